@@ -0,0 +1,156 @@
+import zipfile
+import numpy as np
+import pandas as pd
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+from DownloadCache import DownloadCache
+from Stats import Stats
+from TemperatureTimeCourse import TemperatureTimeCourse
+
+
+class Aggregates:
+    """
+    Day, month and year aggregates of a TemperatureTimeCourse in a
+    calendar (Europe/Berlin by default).
+
+    Every level holds per period its key range, the mean temperature (from
+    the integral, the same value calc_mean_temperature gives), minimum and
+    maximum of the samples, coverage (share of the period with samples)
+    and heating degree days. Calendar periods are read from their level
+    directly, summary() combines whole years, months and days inside an
+    interval with the samples at its edges. The aggregates are built once
+    from the series, TemperatureTimeCourse.aggregates() keeps them until
+    the series changes.
+    """
+
+    levels = ('year', 'month', 'day')  # coarse to fine
+    # heating degree days (Gradtagzahl, VDI 3807): room_temperature - mean of every day with a mean below heating_limit
+    room_temperature = 20.0
+    heating_limit = 15.0
+
+    def __init__(self, course: TemperatureTimeCourse, tz: ZoneInfo = None):
+        self.course = course
+        self.tz = tz if tz is not None else TemperatureTimeCourse.berlin
+        with Stats.phase_of(course.stats, 'aggregate'):
+            self.build()
+
+    def local_date(self, key: int) -> np.datetime64:
+        t = datetime.fromtimestamp(int(key) + TemperatureTimeCourse.basetime.timestamp(), self.tz)
+        return np.datetime64(t.date(), 'D')
+
+    def period_keys(self, periods: np.ndarray) -> np.ndarray:
+        # keys of local midnight at the first day of every period
+        t = pd.DatetimeIndex(periods.astype('datetime64[D]')).tz_localize(self.tz, nonexistent='shift_forward')
+        return TemperatureTimeCourse.datetimes_to_keys(t)
+
+    def build(self):
+        course = self.course
+        assert len(course) >= 2
+        temperatures = np.asarray(course.temperatures) / course.temperature_scale
+        # nominal sampling step of the product, a period is fully covered with (duration / step) samples
+        self.step = float(np.median(np.diff(course.keys)))
+        first = self.local_date(course.keys[0])
+        days = np.arange(first, self.local_date(course.keys[-1]) + 2)
+        day_keys = self.period_keys(days)
+        self.sample_index = course.search(day_keys)
+        counts = np.diff(self.sample_index)
+        nonempty = counts > 0
+        minimum = np.full(len(counts), np.nan)
+        maximum = np.full(len(counts), np.nan)
+        # empty days start where the next day starts, so the segments of the non-empty days end at the right sample
+        minimum[nonempty] = np.minimum.reduceat(temperatures, self.sample_index[:-1][nonempty])
+        maximum[nonempty] = np.maximum.reduceat(temperatures, self.sample_index[:-1][nonempty])
+        day = self.level(days, day_keys, np.arange(len(days)), minimum, maximum, None)
+        self.data = {'day': day}
+        for (name, unit) in (('month', 'M'), ('year', 'Y')):
+            periods = np.arange(days[0].astype(f'datetime64[{unit}]'), days[-2].astype(f'datetime64[{unit}]') + 2)
+            # first day of every period as day index, the periods at both ends are cut to the days with samples
+            bounds = np.clip((periods.astype('datetime64[D]') - first).astype(np.int64), 0, len(days) - 1)
+            self.data[name] = self.level(periods, self.period_keys(periods), bounds, np.fmin.reduceat(minimum, bounds[:-1]),
+                                         np.fmax.reduceat(maximum, bounds[:-1]), np.add.reduceat(np.nan_to_num(day['hdd']), bounds[:-1]))
+
+    def level(self, periods: np.ndarray, keys: np.ndarray, bounds: np.ndarray, minimum: np.ndarray, maximum: np.ndarray, hdd: np.ndarray) -> dict:
+        # periods and keys include the start of the period after the last one, bounds are the day indices of the keys
+        duration = np.diff(keys)
+        mean = np.diff(self.course.integrate_keys(keys)) / duration
+        counts = np.diff(self.sample_index[bounds])
+        if hdd is None:
+            hdd = np.where(mean < Aggregates.heating_limit, Aggregates.room_temperature - mean, 0.0)
+            hdd[counts == 0] = np.nan
+        return {'period': periods[:-1], 'key0': keys[:-1], 'key1': keys[1:], 'mean': mean, 'min': minimum, 'max': maximum,
+                'coverage': np.minimum(counts * self.step / duration, 1.0), 'hdd': hdd, 'samples': counts}
+
+    def lookup(self, name: str, period: np.datetime64) -> dict:
+        data = self.data[name]
+        i = int(np.searchsorted(data['period'], period))
+        if i == len(data['period']) or data['period'][i] != period:
+            return None
+        return {column: values[i].item() for column, values in data.items() if column != 'period'}
+
+    def day(self, d: date) -> dict:
+        return self.lookup('day', np.datetime64(d, 'D'))
+
+    def month(self, year: int, month: int) -> dict:
+        return self.lookup('month', np.datetime64(f'{year:04d}-{month:02d}', 'M'))
+
+    def year(self, year: int) -> dict:
+        return self.lookup('year', np.datetime64(f'{year:04d}', 'Y'))
+
+    def frame(self, name: str = 'day') -> pd.DataFrame:
+        return pd.DataFrame(self.data[name]).set_index('period')
+
+    def summary(self, t0: datetime, t1: datetime) -> dict:
+        key0 = TemperatureTimeCourse.datetime_to_key(self.course.assure_awareness(t0))
+        key1 = TemperatureTimeCourse.datetime_to_key(self.course.assure_awareness(t1))
+        return self.summary_keys(key0, key1)
+
+    def summary_keys(self, key0: int, key1: int) -> dict:
+        # min and max of all samples in [key0, key1), heating degree days of the whole days in it
+        assert key1 > key0
+        (minimum, maximum, hdd) = self.cover(0, key0, key1)
+        samples = int(self.course.search(key1) - self.course.search(key0))
+        return {'key0': key0, 'key1': key1, 'mean': self.course.mean_between_keys(key0, key1), 'min': minimum, 'max': maximum,
+                'coverage': min(samples * self.step / (key1 - key0), 1.0), 'hdd': hdd, 'samples': samples}
+
+    def cover(self, level: int, key0: int, key1: int) -> (float, float, float):
+        # the periods of this level lying completely within [key0, key1), the rest at both ends from the next finer level
+        if key0 >= key1:
+            return (np.nan, np.nan, 0.0)
+        if level == len(Aggregates.levels):
+            (i0, i1) = (int(self.course.search(key0)), int(self.course.search(key1)))
+            if i0 == i1:
+                return (np.nan, np.nan, 0.0)
+            temperatures = np.asarray(self.course.temperatures[i0:i1]) / self.course.temperature_scale
+            return (float(temperatures.min()), float(temperatures.max()), 0.0)
+        data = self.data[Aggregates.levels[level]]
+        j0 = int(np.searchsorted(data['key0'], key0, side='left'))
+        j1 = int(np.searchsorted(data['key1'], key1, side='right'))
+        if j0 >= j1:
+            return self.cover(level + 1, key0, key1)
+        left = self.cover(level + 1, key0, int(data['key0'][j0]))
+        right = self.cover(level + 1, int(data['key1'][j1 - 1]), key1)
+        return (float(np.fmin.reduce([left[0], right[0], np.fmin.reduce(data['min'][j0:j1])])),
+                float(np.fmax.reduce([left[1], right[1], np.fmax.reduce(data['max'][j0:j1])])),
+                left[2] + right[2] + float(np.nansum(data['hdd'][j0:j1])))
+
+    def load_daily_kl(station: str = '13777', cache: DownloadCache = None) -> pd.DataFrame:
+        # recent daily climate summary (KL) of the station: TMK mean, TNK minimum and TXK maximum per day, NaN if missing
+        cache = cache if cache is not None else DownloadCache()
+        fn = cache.fetch(TemperatureTimeCourse.url0 + f'/daily/kl/recent/tageswerte_KL_{station}_akt.zip')
+        with zipfile.ZipFile(fn, 'r') as z:
+            matches = [match for match in z.namelist() if 'produkt_klima_tag_' in match]
+            assert len(matches) == 1
+            with z.open(matches[0]) as f:
+                df = pd.read_csv(f, sep=';', skipinitialspace=True, encoding='latin-1', na_values=[-999])
+        df.columns = [column.strip() for column in df.columns]
+        return pd.DataFrame({'TMK': df['TMK'].to_numpy(), 'TNK': df['TNK'].to_numpy(), 'TXK': df['TXK'].to_numpy()},
+                            index=pd.Index(pd.to_datetime(df['MESS_DATUM'].astype(str), format='%Y%m%d').to_numpy().astype('datetime64[D]'), name='period'))
+
+    def cross_check(self, kl: pd.DataFrame) -> pd.DataFrame:
+        # day level next to the KL values (see load_daily_kl) and the differences; KL days are UTC days,
+        # so compare with Aggregates(course, tz=TemperatureTimeCourse.utc) for the closest match
+        df = self.frame('day')[['mean', 'min', 'max', 'coverage']].join(kl, how='inner')
+        df['d_mean'] = df['mean'] - df['TMK']
+        df['d_min'] = df['min'] - df['TNK']
+        df['d_max'] = df['max'] - df['TXK']
+        return df
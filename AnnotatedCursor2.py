@@ -1,7 +1,9 @@
 import matplotlib.pyplot as plt
 import numpy as np
 import logging
-from matplotlib.backend_bases import MouseEvent
+import time
+from matplotlib.backend_bases import MouseEvent, TimerBase
+from matplotlib.transforms import Bbox
 from matplotlib.widgets import Cursor
 
 
@@ -55,11 +57,30 @@ class AnnotatedCursor2(Cursor):
 
     """
 
+    # Hits are accepted within sqrt(max_dist2) pixels, the grid cells of the
+    # pixel index are at least that wide
+    max_dist2: float = 10.0
+    cell_size: float = 4.0
+    cell_stride: int = 1 << 32
+    # Minimum time between two redraws in seconds
+    frame_interval: float = 1 / 30
+
     def __init__(self, data, linear_regression, offset=(5, 5), textprops=None, **cursorargs):
         if textprops is None:
             textprops = {}
         # The line object, for which the coordinates are displayed
         self.data = data
+        # Columns of the scatter plot as arrays, looked up by index in nearest_index
+        self.xdata = data['temperatur'].to_numpy(dtype=float)
+        self.ydata = data['energy_per_day'].to_numpy(dtype=float)
+        self.t0 = list(data['t0'])
+        self.t1 = list(data['t1'])
+        # Pixel coordinates of all points and the grid index over them,
+        # computed on demand and invalidated on redraw and limit changes
+        self.pixel_index = None
+        # Text, position, alignment and pixel extent of the label per point,
+        # invalidated together with the pixel index
+        self.label_layouts = {}
         # The format string, on which .format() is called for creating the text
         self.linear_regression = linear_regression
         # Text position offset
@@ -69,9 +90,22 @@ class AnnotatedCursor2(Cursor):
         # Draws cursor and remembers background for blitting.
         # Saves ax as class attribute.
         super().__init__(**cursorargs)
+        self.ax.callbacks.connect('xlim_changed', self.invalidate_layout)
+        self.ax.callbacks.connect('ylim_changed', self.invalidate_layout)
+
+        # Motion events are coalesced: only the latest one is drawn, at most
+        # once per frame_interval. Backends without timers draw every event.
+        self.pending_event = None
+        self.last_frame = 0.0
+        self.timer = self.canvas.new_timer()
+        if type(self.timer) is TimerBase:
+            self.timer = None
+        else:
+            self.timer.single_shot = True
+            self.timer.add_callback(self.process_pending_event)
 
         # Default value for position of text.
-        self.set_position(self.data.iloc[0]['temperatur'], self.data.iloc[0]['energy_per_day'],0,0)
+        self.set_position(self.xdata[0], self.ydata[0], 0, 0)
         # Create invisible animated text
         self.text = self.ax.text(
             self.ax.get_xbound()[0],
@@ -79,149 +113,242 @@ class AnnotatedCursor2(Cursor):
             "0, 0",
             animated=bool(self.useblit),
             visible=False, **textprops)
-        # The position at which the cursor was last drawn
-        self.lastdrawnplotpoint = None
+        # The index of the point at which the cursor was last drawn
+        self.lastdrawnindex = None
+        # Pixel extents of the cursor lines and text on screen, restored
+        # from the background on the next blit; None if unknown
+        self.drawn_extents = None
 
     def onmove(self, event):
         """
         Overridden draw callback for cursor. Called when moving the mouse.
+
+        Only remembers the event, if the last redraw is less than
+        *frame_interval* ago. A timer then draws the latest event, all
+        events in between are dropped.
+        """
+
+        deferred = self.pending_event is not None
+        self.pending_event = event
+        if deferred:
+            return
+        wait = self.last_frame + self.frame_interval - time.monotonic()
+        if wait <= 0 or self.timer is None:
+            self.process_pending_event()
+        else:
+            self.timer.interval = max(1, int(wait * 1000))
+            self.timer.start()
+
+    def process_pending_event(self):
+        event = self.pending_event
+        self.pending_event = None
+        if event is None:
+            return
+        self.last_frame = time.monotonic()
+        self.move_to(event)
+
+    def move_to(self, event):
+        """
+        Draws cursor and text for a motion event.
         """
 
         # Leave method under the same conditions as in overridden method
         if self.ignore(event):
-            self.lastdrawnplotpoint = None
+            self.lastdrawnindex = None
             return
         if not self.canvas.widgetlock.available(self):
-            self.lastdrawnplotpoint = None
+            self.lastdrawnindex = None
             return
 
         # If the mouse left drawable area, we now make the text invisible.
         # Baseclass will redraw complete canvas after, which makes both text
         # and cursor disappear.
         if event.inaxes != self.ax:
-            self.lastdrawnplotpoint = None
+            self.lastdrawnindex = None
+            self.drawn_extents = None
             self.text.set_visible(False)
             super().onmove(event)
             return
 
-        # Get the coordinates, which should be displayed as text,
+        # Get the point, whose time interval should be displayed as text,
         # if the event coordinates are valid.
-        plotpoint = None
+        index = None
         if event.xdata is not None and event.ydata is not None:
-            # Get plot point related to current x position.
-            # These coordinates are displayed in text.
-            plotpoint = self.set_position(event.xdata, event.ydata, event.x, event.y)
+            index = self.nearest_index(event.x, event.y)
             # Modify event, such that the cursor is displayed on the
-            # plotted line, not at the mouse pointer,
-            # if the returned plot point is valid
-            if plotpoint is not None:
-                event.xdata = plotpoint[0]
-                event.ydata = plotpoint[1]
+            # plotted point, not at the mouse pointer,
+            # if there is a point close enough
+            if index is not None:
+                event.xdata = self.xdata[index]
+                event.ydata = self.ydata[index]
 
-        # If the plotpoint is given, compare to last drawn plotpoint and
+        # If there is a point, compare to last drawn point and
         # return if they are the same.
         # Skip even the call of the base class, because this would restore the
         # background, draw the cursor lines and would leave us the job to
         # re-draw the text.
-        if plotpoint is not None and plotpoint == self.lastdrawnplotpoint:
+        if index is not None and index == self.lastdrawnindex:
             return
 
-        # Remember the recently drawn cursor position, so events for the
-        # same position (mouse moves slightly between two plot points)
-        # can be skipped
-        self.lastdrawnplotpoint = plotpoint
+        # Remember the recently drawn point, so events for the
+        # same point (mouse moves slightly around it) can be skipped
+        self.lastdrawnindex = index
 
-        # Baseclass redraws canvas and cursor. Due to blitting,
-        # the added text is removed in this call, because the
-        # background is redrawn.
-        super().onmove(event)
+        if self.useblit:
+            self.blit_cursor(event, index)
+            return
 
-        # Check if the display of text is still necessary.
-        # If not, just return.
-        # This behaviour is also cloned from the base class.
+        # Baseclass updates the cursor lines and requests a redraw
+        super().onmove(event)
         if not self.get_active() or not self.visible:
             return
-
-        # Draw the widget, if event coordinates are valid.
-        if plotpoint is not None:
-            # Update position and displayed text.
-            # Position: Where the event occurred.
-            # Text: Determined by set_position() method earlier
-            # Position is transformed to pixel coordinates,
-            # an offset is added there and this is transformed back.
-            y_regression = self.linear_regression['a'] * event.xdata + self.linear_regression['b']
-            if event.ydata > y_regression:
-                self.text.set_horizontalalignment('left')
-                self.text.set_verticalalignment('bottom')
-                self.offset = np.absolute(self.offset)
-            else:
-                self.text.set_horizontalalignment('right')
-                self.text.set_verticalalignment('top')
-                self.offset = np.absolute(self.offset) * -1
-
-            temp = [event.xdata, event.ydata]
-            temp = self.ax.transData.transform(temp)
-            temp = temp + self.offset
-            temp = self.ax.transData.inverted().transform(temp)
-            self.text.set_position(temp)
-            t0 = plotpoint[2]
-            t1 = plotpoint[3]
-            dateformat = '%d.%m.%Y %H:%M'
-            self.text.set_text(t0.strftime(dateformat) + '\n' + t1.strftime(dateformat))
-            self.text.set_visible(self.visible)
-            reposition_text = False
-
-            x_limits = self.ax.xaxis.get_view_interval()
-            y_limits = self.ax.yaxis.get_view_interval()
-            renderer = self.ax.figure.canvas.get_renderer()
-            t_bbox = self.text.get_window_extent(renderer)
-            (x0, y0) = self.ax.transData.inverted().transform((t_bbox.x0, t_bbox.y0))
-            (x1, y1) = self.ax.transData.inverted().transform((t_bbox.x1, t_bbox.y1))
-            if x0 < x_limits[0]:
-                self.text.set_horizontalalignment('left')
-                self.offset[0] = -self.offset[0]
-                reposition_text = True
-            if x1 > x_limits[1]:
-                self.text.set_horizontalalignment('right')
-                self.offset[0] = -self.offset[0]
-                reposition_text = True
-            if y0 < y_limits[0]:
-                self.text.set_verticalalignment('bottom')
-                self.offset[1] = -self.offset[1]
-                reposition_text = True
-            if y1 > y_limits[1]:
-                self.text.set_verticalalignment('top')
-                self.offset[1] = -self.offset[1]
-                reposition_text = True
-            if reposition_text: 
-                temp = [event.xdata, event.ydata]
-                temp = self.ax.transData.transform(temp)
-                temp = temp + self.offset
-                temp = self.ax.transData.inverted().transform(temp)
-                self.text.set_position(temp)
-
-            #print(f'x_limits={x_limits}, y_limits={y_limits}, t_x0y0={(x0,y0)}, t_x1y1={(x1,y1)} t_bbox={t_bbox}')
-
+        self.update_text(index)
+        if index is not None:
             # Tell base class, that we have drawn something.
             # Baseclass needs to know, that it needs to restore a clean
             # background, if the cursor leaves our figure context.
             self.needclear = True
+        # If blitting is deactivated, the overridden _update call made
+        # by the base class immediately returned.
+        # We still have to draw the changes.
+        self.canvas.draw_idle()
+
+    def update_text(self, index):
+        """
+        Shows the label of the point *index* or hides the text if *index* is None.
+        """
 
-        # otherwise, make text invisible
+        if index is None:
+            self.text.set_visible(False)
+            return
+        (text, position, ha, va, extent) = self.label_layout(index)
+        self.text.set_text(text)
+        self.text.set_position(position)
+        self.text.set_horizontalalignment(ha)
+        self.text.set_verticalalignment(va)
+        self.text.set_visible(self.visible)
+
+    def label_layout(self, index):
+        """
+        Text, position in data coordinates, alignment and pixel extent
+        (including the bbox patch) of the label of point *index*.
+
+        The label is placed above the regression line next to points above
+        it and below otherwise, and flipped to the other side of the point
+        where it would leave the axes. Layouts are computed in pixel
+        coordinates and cached until the next redraw or limit change.
+        """
+
+        layout = self.label_layouts.get(index)
+        if layout is not None:
+            return layout
+        if self.pixel_index is None:
+            self.build_pixel_index()
+        (px, py) = self.pixel_index[0][index]
+        dateformat = '%d.%m.%Y %H:%M'
+        text = self.t0[index].strftime(dateformat) + '\n' + self.t1[index].strftime(dateformat)
+        # size of the text box, it does not depend on position and alignment
+        self.text.set_text(text)
+        self.text.set_visible(True)
+        t_bbox = self.text.get_window_extent(self.canvas.get_renderer())
+        (w, h) = (t_bbox.width, t_bbox.height)
+        # the bbox patch (and antialiasing) reaches beyond the text on every side
+        (ex0, ey0, _, _) = self.text_extent()
+        (mx, my) = (t_bbox.x0 - ex0, t_bbox.y0 - ey0)
+        y_regression = self.linear_regression['a'] * self.xdata[index] + self.linear_regression['b']
+        (ox, oy) = np.absolute(self.offset) * (1 if self.ydata[index] > y_regression else -1)
+        box = self.ax.bbox
+        if (ox > 0 and px + ox + w + mx > box.x1) or (ox < 0 and px + ox - w - mx < box.x0):
+            ox = -ox
+        if (oy > 0 and py + oy + h + my > box.y1) or (oy < 0 and py + oy - h - my < box.y0):
+            oy = -oy
+        x0 = px + ox if ox > 0 else px + ox - w
+        y0 = py + oy if oy > 0 else py + oy - h
+        position = self.ax.transData.inverted().transform((px + ox, py + oy))
+        layout = (text, position, 'left' if ox > 0 else 'right', 'bottom' if oy > 0 else 'top', (x0 - mx, y0 - my, x0 + w + mx, y0 + h + my))
+        self.label_layouts[index] = layout
+        return layout
+
+    def blit_cursor(self, event, index):
+        """
+        Draws cursor lines and text with blitting, restoring and blitting only
+        the pixels covered by them before and after the move.
+        """
+
+        self.needclear = True
+        self.linev.set_xdata((event.xdata, event.xdata))
+        self.linev.set_visible(self.visible and self.vertOn)
+        self.lineh.set_ydata((event.ydata, event.ydata))
+        self.lineh.set_visible(self.visible and self.horizOn)
+        if self.get_active() and self.visible:
+            self.update_text(index)
         else:
             self.text.set_visible(False)
 
-        # Draw changes. Cannot use _update method of baseclass,
-        # because it would first restore the background, which
-        # is done already and is not necessary.
-        if self.useblit:
-            self.ax.draw_artist(self.text)
-            self.canvas.blit(self.ax.bbox)
+        box = self.ax.bbox
+        if index is not None:
+            (x, y) = self.pixel_index[0][index]
         else:
-            # If blitting is deactivated, the overridden _update call made
-            # by the base class immediately returned.
-            # We still have to draw the changes.
-            self.canvas.draw_idle()
+            (x, y) = (event.x, event.y)
+        margin = self.linev.get_linewidth() * self.ax.figure.dpi / 72 / 2 + 2
+        extents = []
+        if self.linev.get_visible():
+            extents.append((x - margin, box.y0, x + margin, box.y1))
+        if self.lineh.get_visible():
+            extents.append((box.x0, y - margin, box.x1, y + margin))
+        if self.text.get_visible():
+            extents.append(self.text_extent())
+        # clip to the axes, the background covers nothing else
+        extents = [(max(x0, box.x0), max(y0, box.y0), min(x1, box.x1), min(y1, box.y1))
+                   for (x0, y0, x1, y1) in extents]
+        extents = [e for e in extents if e[0] < e[2] and e[1] < e[3]]
+
+        background = self.blit_background()
+        if background is None or self.drawn_extents is None:
+            dirty = [box.extents]
+        else:
+            dirty = list(dict.fromkeys(self.drawn_extents + extents))
+        if background is not None:
+            for extent in dirty:
+                self.restore_background(background, extent)
+        self.ax.draw_artist(self.linev)
+        self.ax.draw_artist(self.lineh)
+        self.ax.draw_artist(self.text)
+        if hasattr(self.canvas, 'get_diff_image'):
+            # web backends send the changes of the whole canvas with every blit
+            self.canvas.blit(box)
+        else:
+            for (x0, y0, x1, y1) in dirty:
+                self.canvas.blit(Bbox.from_extents(np.floor(x0), np.floor(y0), np.ceil(x1), np.ceil(y1)))
+        self.drawn_extents = extents
+
+    def text_extent(self):
+        # pixels covered by the positioned text including its bbox patch (padding and edge), plus 1 px of antialiasing
+        renderer = self.canvas.get_renderer()
+        patch = self.text.get_bbox_patch()
+        if patch is None:
+            bbox = self.text.get_window_extent(renderer)
+            margin = 1
+        else:
+            self.text.update_bbox_position_size(renderer)
+            bbox = patch.get_window_extent(renderer)
+            margin = patch.get_linewidth() * self.ax.figure.dpi / 72 / 2 + 1
+        return (bbox.x0 - margin, bbox.y0 - margin, bbox.x1 + margin, bbox.y1 + margin)
+
+    def blit_background(self):
+        # newer matplotlib versions keep the background per canvas behind these methods
+        if hasattr(self, '_load_blit_background'):
+            return self._load_blit_background()
+        return getattr(self, 'background', None)
+
+    def restore_background(self, background, extent):
+        # restore_region addresses the Agg buffer in rows counted from the top
+        (x0, y0, x1, y1) = extent
+        height = self.canvas.get_renderer().height
+        (rx, ry) = background.get_extents()[:2]
+        self.canvas.restore_region(background,
+                                   bbox=(int(np.floor(x0)), int(height - np.ceil(y1)), int(np.ceil(x1)), int(height - np.floor(y0))),
+                                   xy=(rx, ry))
 
     def set_position(self, xpos, ypos, x, y):
         """
@@ -245,27 +372,55 @@ class AnnotatedCursor2(Cursor):
             *None* is the fallback value.
         """
 
-        ret_coords = None # default return value is None if no point is close enough to the cursor coordinates
-        i_min: int = -1
-        min_dist: float = 999999.0
-        for i in range(len(self.data)):
-            xdata = self.data.iloc[i]['temperatur']
-            ydata = self.data.iloc[i]['energy_per_day']
-            # transform to pixel coordinates since this is the only coordinate system to measure meaningful distances
-            xi, yi = self.ax.transData.transform([xdata, ydata])
-            # squared euclidean distance in 2D
-            dist: float = (x - xi) **2 + (y - yi) **2
-            if dist < min_dist:
-                min_dist = dist
-                i_min = i
-        if min_dist < 10.0:
-            ret_coords = [self.data.iloc[i_min]['temperatur'], 
-                          self.data.iloc[i_min]['energy_per_day'], 
-                          self.data.iloc[i_min]['t0'],
-                          self.data.iloc[i_min]['t1']]
-#        print(f'min_dist={min_dist}, ret_coords={ret_coords}')
-
-        return ret_coords
+        i_min = self.nearest_index(x, y)
+        if i_min is None:
+            # no point is close enough to the cursor coordinates
+            return None
+        return [self.xdata[i_min], self.ydata[i_min], self.t0[i_min], self.t1[i_min]]
+
+    def nearest_index(self, x, y):
+        """
+        Index of the point closest to the pixel position (*x*, *y*), None if
+        no point is within sqrt(max_dist2) pixels.
+        """
+
+        if self.pixel_index is None:
+            self.build_pixel_index()
+        (pixels, order, cells) = self.pixel_index
+        # only points in the 3x3 grid cells around the cursor can be closer than max_dist
+        cx = int(np.floor(x / self.cell_size))
+        cy = int(np.floor(y / self.cell_size))
+        neighbours = np.array([(cx + i) * self.cell_stride + cy + j for i in (-1, 0, 1) for j in (-1, 0, 1)])
+        lo = np.searchsorted(cells, neighbours, side='left')
+        hi = np.searchsorted(cells, neighbours, side='right')
+        candidates = np.concatenate([order[l:h] for (l, h) in zip(lo, hi)])
+        if len(candidates) == 0:
+            return None
+        # squared euclidean distance in 2D, measured in pixel coordinates
+        # since this is the only coordinate system to measure meaningful distances
+        dist = (x - pixels[candidates, 0]) **2 + (y - pixels[candidates, 1]) **2
+        k = int(np.argmin(dist))
+        if dist[k] >= self.max_dist2:
+            return None
+        return int(candidates[k])
+
+    def build_pixel_index(self):
+        """
+        Transforms all points to pixel coordinates at once and sorts them into
+        a uniform grid, so nearest_index only has to look at the cells around
+        the cursor.
+        """
+        pixels = self.ax.transData.transform(np.column_stack((self.xdata, self.ydata)))
+        valid = np.flatnonzero(np.isfinite(pixels).all(axis=1))
+        cells = np.floor(pixels[valid] / self.cell_size).astype(np.int64)
+        cells = cells[:, 0] * self.cell_stride + cells[:, 1]
+        order = valid[np.argsort(cells, kind='stable')]
+        cells = np.sort(cells, kind='stable')
+        self.pixel_index = (pixels, order, cells)
+
+    def invalidate_layout(self, *args):
+        self.pixel_index = None
+        self.label_layouts = {}
 
     def clear(self, event):
         """
@@ -276,6 +431,10 @@ class AnnotatedCursor2(Cursor):
         # Text and cursor are invisible,
         # until the first mouse move event occurs.
         super().clear(event)
+        # limits, figure size or dpi may have changed with this draw,
+        # the new background shows neither cursor nor text
+        self.invalidate_layout()
+        self.drawn_extents = None
         if self.ignore(event):
             return
         self.text.set_visible(False)
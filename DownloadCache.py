@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+import time
+from Stats import Stats
+
+
+class DownloadCache:
+    """
+    Local copy of downloaded DWD archives.
+
+    Every archive is stored as *cache_dir*/<file name> together with a
+    <file name>.json holding url, ETag, Last-Modified, fetch time and
+    max-age. A cached archive younger than *max_age* seconds is used as is,
+    an older one is revalidated with a conditional GET and only downloaded
+    again if the server reports a change. With *offline* set the network is
+    never touched and only cached archives are available.
+    A *session* (see make_session) is used for all requests if given, so
+    several threads can share its connection pool. Requests give up after
+    *timeout* = (connect, read) seconds, a stalled server is treated like
+    an unreachable one.
+    With *stats* (see Stats.py) set, downloads, bytes and cache hits are
+    counted and the requests timed as phase 'download'.
+    """
+
+    def __init__(self, cache_dir: str = 'dwdcache', max_age: float = 3600.0, offline: bool = False, session=None, stats: Stats = None,
+                 timeout: tuple = (10.0, 60.0)):
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        self.max_age = max_age
+        self.offline = offline
+        self.session = session
+        self.stats = stats
+
+    def make_session(pool_size: int = 8, retries: int = 3):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def part_name(fn: str) -> str:
+        # temporary file private to this thread, renamed into place when complete
+        return f'{fn}.{os.getpid()}.{threading.get_ident()}.part'
+
+    def paths(self, url: str, name: str = None) -> (str, str):
+        fn = os.path.join(self.cache_dir, name if name is not None else url.rsplit('/', 1)[-1])
+        return (fn, fn + '.json')
+
+    def load_metadata(self, url: str, name: str = None) -> dict:
+        (fn, fnmeta) = self.paths(url, name)
+        if not (os.path.exists(fn) and os.path.exists(fnmeta)):
+            return None
+        with open(fnmeta, 'r') as f:
+            meta = json.load(f)
+        if meta.get('url') != url:
+            return None
+        return meta
+
+    def save_metadata(self, url: str, meta: dict, name: str = None):
+        (fn, fnmeta) = self.paths(url, name)
+        fnpart = DownloadCache.part_name(fnmeta)
+        with open(fnpart, 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(fnpart, fnmeta)
+
+    def is_fresh(self, meta: dict, max_age: float) -> bool:
+        return time.time() - meta['fetched'] < min(meta['max_age'], max_age)
+
+    def fetch(self, url: str, name: str = None, max_age: float = None) -> str:
+        # name: file name in the cache, defaults to the last part of the url
+        # max_age: overrides the default max-age of this cache for this url
+        if max_age is None:
+            max_age = self.max_age
+        (fn, fnmeta) = self.paths(url, name)
+        meta = self.load_metadata(url, name)
+        if self.offline:
+            assert meta is not None, f'offline mode: {url} is not in cache {self.cache_dir}'
+            if self.stats is not None:
+                self.stats.count('download_cache_hits')
+            return fn
+        if meta is not None and self.is_fresh(meta, max_age):
+            if self.stats is not None:
+                self.stats.count('download_cache_hits')
+            return fn
+        with Stats.phase_of(self.stats, 'download'):
+            return self.download(url, fn, meta, max_age, name)
+
+    def download(self, url: str, fn: str, meta: dict, max_age: float, name: str = None) -> str:
+        # conditional GET, the cached file is only replaced if the server has a different version
+        headers = {}
+        if meta is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        import requests  # deferred, importing requests costs more than a cache hit
+        try:
+            r = (self.session if self.session is not None else requests).get(url, headers=headers, stream=True, timeout=self.timeout)
+        except requests.RequestException:
+            # server unreachable or failing (also after the retries of a session), fall back to whatever is cached
+            if meta is None:
+                raise
+            return fn
+        if meta is not None and not r.ok and r.status_code != 304:
+            r.close()
+            return fn
+        if meta is None or r.status_code != 304:
+            assert r.ok, f'{url}: {r.status_code} {r.reason}'
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # stream the body to disk, the archive is never held in memory as a whole
+            fnpart = DownloadCache.part_name(fn)
+            try:
+                with open(fnpart, 'wb') as outf:
+                    for chunk in r.iter_content(chunk_size=1 << 16):
+                        outf.write(chunk)
+            except requests.RequestException:
+                # the body stalled (read timeout) or broke off, keep the cached version if there is one
+                os.remove(fnpart)
+                if meta is None:
+                    raise
+                return fn
+            os.replace(fnpart, fn)
+            if self.stats is not None:
+                self.stats.count('downloads')
+                self.stats.count('bytes_downloaded', os.path.getsize(fn))
+            meta = {'url': url, 'etag': r.headers.get('ETag'), 'last_modified': r.headers.get('Last-Modified')}
+        elif self.stats is not None:
+            self.stats.count('not_modified')
+        meta['fetched'] = time.time()
+        meta['max_age'] = max_age
+        self.save_metadata(url, meta, name)
+        return fn
@@ -0,0 +1,85 @@
+import numpy as np
+
+
+class LinearRegression:
+    """
+    Online (weighted) linear regression y = a*t + b.
+
+    Keeps weighted means and co-moments of t and y, which are updated in
+    O(1) per point when intervals are added or removed (or in one vectorized
+    step for a batch, combined with the parallel update formula). fit()
+    returns a, b, R**2 and the standard errors of a and b without another
+    pass over the data. Weights are relative precisions, e.g. the interval
+    duration dt.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.sw = 0.0
+        self.mt = 0.0
+        self.my = 0.0
+        self.ctt = 0.0
+        self.cty = 0.0
+        self.cyy = 0.0
+
+    def batch(t, y, w) -> tuple:
+        t = np.atleast_1d(np.asarray(t, dtype=float))
+        y = np.atleast_1d(np.asarray(y, dtype=float))
+        w = np.ones(len(t)) if w is None else np.broadcast_to(np.asarray(w, dtype=float), t.shape)
+        sw = w.sum()
+        if sw == 0:
+            return (len(t), 0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+        mt = (w * t).sum() / sw
+        my = (w * y).sum() / sw
+        return (len(t), sw, mt, my, (w * (t - mt)**2).sum(), (w * (t - mt) * (y - my)).sum(), (w * (y - my)**2).sum())
+
+    def add(self, t, y, w=None):
+        (n, sw, mt, my, ctt, cty, cyy) = LinearRegression.batch(t, y, w)
+        if sw == 0:
+            return
+        total = self.sw + sw
+        dt = mt - self.mt
+        dy = my - self.my
+        f = self.sw * sw / total
+        self.ctt += ctt + dt * dt * f
+        self.cty += cty + dt * dy * f
+        self.cyy += cyy + dy * dy * f
+        self.mt += dt * sw / total
+        self.my += dy * sw / total
+        self.sw = total
+        self.n += n
+
+    def remove(self, t, y, w=None):
+        (n, sw, mt, my, ctt, cty, cyy) = LinearRegression.batch(t, y, w)
+        if sw == 0:
+            return
+        rest = self.sw - sw
+        if self.n - n <= 0 or rest <= 0:
+            self.__init__()
+            return
+        # invert the update of add(): moments of the remaining points
+        mt_rest = (self.sw * self.mt - sw * mt) / rest
+        my_rest = (self.sw * self.my - sw * my) / rest
+        dt = mt - mt_rest
+        dy = my - my_rest
+        f = rest * sw / self.sw
+        self.ctt -= ctt + dt * dt * f
+        self.cty -= cty + dt * dy * f
+        self.cyy -= cyy + dy * dy * f
+        self.mt = mt_rest
+        self.my = my_rest
+        self.sw = rest
+        self.n -= n
+
+    def fit(self) -> dict:
+        assert self.n >= 2 and self.ctt > 0
+        a = self.cty / self.ctt
+        b = self.my - a * self.mt
+        ssr = max(self.cyy - a * self.cty, 0.0)
+        R2 = 1 - ssr / self.cyy if self.cyy > 0 else 1.0
+        ret = {'a': float(a), 'b': float(b), 'R**2': float(R2), 'n': self.n}
+        if self.n > 2:
+            sigma2 = ssr / (self.n - 2)
+            ret['se_a'] = float(np.sqrt(sigma2 / self.ctt))
+            ret['se_b'] = float(np.sqrt(sigma2 * (1 / self.sw + self.mt**2 / self.ctt)))
+        return ret
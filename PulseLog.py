@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+from Stats import Stats
+from TemperatureTimeCourse import TemperatureTimeCourse
+
+
+class PulseLog:
+    """
+    Streaming resampler for the counter log of an optical pulse reader.
+
+    Chunks of (time, counter) samples are passed to add() in time order,
+    only the last sample and the open interval are kept between chunks, so
+    logs of any length are read in constant memory (see read()). Samples
+    out of time order are dropped, a single sample with an implausible step
+    (counter decreasing or rising faster than *max_flow* m³/h) whose
+    neighbours fit each other is dropped as an outlier, any other
+    implausible step (e.g. a counter reset) adds no consumption. Samples
+    are ordered and checked in UTC, naive times are Europe/Berlin local
+    time. The counter is interpolated at every multiple of *interval* in
+    local time (a local time repeated by DST counts once); readings()
+    returns these like read_readings() does for Ablesung-Gas.xlsx, an
+    interval with a counter jump or a gap longer than *max_gap* gets an
+    entry in Bemerkung and is skipped by calc_intervals.
+    """
+
+    def __init__(self, interval='1D', m3_per_count: float = 1.0, max_flow: float = 6.0, max_gap='1h', stats: Stats = None):
+        self.step = pd.Timedelta(interval).value
+        self.m3_per_count = m3_per_count
+        self.max_flow = max_flow  # m³/h, 6 is Qmax of a G4 meter
+        self.max_gap = pd.Timedelta(max_gap).value
+        self.stats = stats
+        # last processed sample: time (ns, UTC), raw counter (m³), counter without the rejected jumps (m³)
+        self.last = None
+        # the newest sample is held back until its successor shows whether it is an outlier
+        self.pending = (np.zeros(0, dtype=np.int64), np.zeros(0))
+        # a jump / gap since the straddling step of the last boundary, carried into the next chunk
+        self.carry = {'jump': False, 'gap': False}
+        self.boundaries = []
+
+    def add(self, times, counters):
+        t = TemperatureTimeCourse.datetimes_to_utc(times).tz_localize(None).values.astype('datetime64[ns]').astype(np.int64)
+        z = np.asarray(counters, dtype=float) * self.m3_per_count
+        valid = (t != np.iinfo(np.int64).min) & np.isfinite(z)
+        self.process(np.concatenate((self.pending[0], t[valid])), np.concatenate((self.pending[1], z[valid])), final=False)
+
+    def plausible(self, t0: np.ndarray, z0: np.ndarray, t1: np.ndarray, z1: np.ndarray) -> np.ndarray:
+        # a step of one count more than max_flow allows is accepted, the counter is quantized
+        dz = z1 - z0
+        return (dz >= 0) & (dz <= self.max_flow * (t1 - t0) / 3.6e12 + self.m3_per_count)
+
+    def process(self, t: np.ndarray, z: np.ndarray, final: bool):
+        if self.last is not None:
+            t = np.concatenate(([self.last[0]], t))
+            z = np.concatenate(([self.last[1]], z))
+        ordered = t > np.concatenate(([np.iinfo(np.int64).min], np.maximum.accumulate(t)[:-1]))
+        (t, z) = (t[ordered], z[ordered])
+        # an outlier does not fit its predecessor, but its predecessor fits its successor
+        outlier = np.zeros(len(t), dtype=bool)
+        if len(t) >= 3:
+            outlier[1:-1] = ~self.plausible(t[:-2], z[:-2], t[1:-1], z[1:-1]) & self.plausible(t[:-2], z[:-2], t[2:], z[2:])
+        (t, z) = (t[~outlier], z[~outlier])
+        if self.stats is not None:
+            self.stats.count('samples_unordered', int((~ordered).sum()))
+            self.stats.count('samples_outliers', int(outlier.sum()))
+        first = 0 if self.last is None else 1
+        if not final and len(t) > first:
+            self.pending = (t[-1:], z[-1:])
+            (t, z) = (t[:-1], z[:-1])
+        else:
+            self.pending = (np.zeros(0, dtype=np.int64), np.zeros(0))
+        if len(t) == 0:
+            return
+        jump = ~self.plausible(t[:-1], z[:-1], t[1:], z[1:])
+        gap = np.diff(t) > self.max_gap
+        if self.stats is not None:
+            self.stats.count('counter_jumps', int(jump.sum()))
+            self.stats.count('gaps', int(gap.sum()))
+        zc0 = z[0] if self.last is None else self.last[2]
+        zc = zc0 + np.concatenate(([0.0], np.cumsum(np.where(jump, 0.0, np.diff(z)))))
+        self.last = (t[-1], z[-1], zc[-1])
+        # boundaries in (t[0], t[-1]], the one at t[0] belonged to the previous chunk
+        b = self.boundaries_between(t[0], t[-1])
+        if len(b) == 0:
+            for name, bad in (('jump', jump), ('gap', gap)):
+                self.carry[name] |= bool(bad.any())
+            return
+        # step k joins the samples k-1 and k, boundary j lies in step s[j]
+        s = np.searchsorted(t, b, side='left')
+        flags = {}
+        for name, bad in (('jump', jump), ('gap', gap)):
+            # bad steps among 1..k, interval j covers the steps s[j-1]..s[j]
+            count = np.concatenate(([0], np.cumsum(bad)))
+            flagged = np.empty(len(b), dtype=bool)
+            flagged[0] = self.carry[name] or count[s[0]] > 0
+            flagged[1:] = count[s[1:]] - count[s[:-1] - 1] > 0
+            self.carry[name] = bool(count[-1] - count[s[-1] - 1] > 0)
+            flags[name] = flagged
+        bemerkung = np.where(flags['jump'], 'Zählersprung', np.where(flags['gap'], 'Lücke', None))
+        self.boundaries.append((b, np.interp(b, t, zc), bemerkung))
+
+    def boundaries_between(self, t0: int, t1: int) -> np.ndarray:
+        # UTC times of the local multiples of interval, a local time may be shifted by an hour at a DST change
+        (l0, l1) = PulseLog.local_ns(np.array([t0, t1]))
+        margin = max(self.step, 3600 * 10**9)
+        b = np.arange((l0 - margin) // self.step * self.step, l1 + margin, self.step, dtype=np.int64)
+        b = TemperatureTimeCourse.datetimes_to_utc(b.astype('datetime64[ns]')).tz_localize(None).values.astype('datetime64[ns]').astype(np.int64)
+        return np.unique(b[(b > t0) & (b <= t1)])
+
+    def local_ns(t: np.ndarray) -> np.ndarray:
+        # UTC ns as naive Europe/Berlin local time in ns
+        t = pd.DatetimeIndex(t.astype('datetime64[ns]')).tz_localize(TemperatureTimeCourse.utc).tz_convert(TemperatureTimeCourse.berlin)
+        return t.tz_localize(None).values.astype('datetime64[ns]').astype(np.int64)
+
+    def finish(self):
+        if len(self.pending[0]) > 0:
+            self.process(self.pending[0], self.pending[1], final=True)
+
+    def readings(self) -> pd.DataFrame:
+        self.finish()
+        if len(self.boundaries) == 0:
+            return pd.DataFrame({'Ablesezeitpunkt': pd.Series(dtype='datetime64[ns]'), 'Zählerstand': pd.Series(dtype=float), 'Bemerkung': pd.Series(dtype=object)})
+        t = PulseLog.local_ns(np.concatenate([b for (b, _, _) in self.boundaries])).astype('datetime64[ns]')
+        return pd.DataFrame({'Ablesezeitpunkt': t, 'Zählerstand': np.concatenate([z for (_, z, _) in self.boundaries]),
+                             'Bemerkung': np.concatenate([bemerkung for (_, _, bemerkung) in self.boundaries])})
+
+    def read(csv_fn: str, interval='1D', time_column: str = 'timestamp', counter_column: str = 'counter', chunksize: int = 1 << 20,
+             m3_per_count: float = 1.0, max_flow: float = 6.0, max_gap='1h', stats: Stats = None, **read_csv_kwargs) -> pd.DataFrame:
+        # read_csv_kwargs (e.g. sep=';') are passed to pd.read_csv, times are local unless they carry an offset (e.g. UTC logs)
+        log = PulseLog(interval, m3_per_count, max_flow, max_gap, stats)
+        with pd.read_csv(csv_fn, usecols=[time_column, counter_column], chunksize=chunksize, **read_csv_kwargs) as reader:
+            for chunk in reader:
+                if stats is not None:
+                    stats.count('rows_parsed', len(chunk))
+                with Stats.phase_of(stats, 'resample'):
+                    log.add(chunk[time_column], chunk[counter_column])
+        return log.readings()
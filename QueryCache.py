@@ -0,0 +1,42 @@
+import time
+from collections import OrderedDict
+
+
+class QueryCache:
+    """
+    Bounded LRU cache for results of repeated point and interval queries.
+
+    At most *maxsize* results are kept, the least recently used one is
+    evicted first. With *ttl* (seconds) set, results older than that are
+    computed again. Hits, misses and evictions are counted, see stats().
+    """
+
+    def __init__(self, maxsize: int = 4096, ttl: float = None):
+        assert maxsize > 0
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, compute):
+        entry = self.entries.get(key)
+        if entry is not None and (self.ttl is None or time.monotonic() - entry[1] < self.ttl):
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        value = compute()
+        self.entries[key] = (value, time.monotonic())
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return value
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self.entries), 'maxsize': self.maxsize}
@@ -0,0 +1,79 @@
+import os
+import numpy as np
+import pandas as pd
+from TemperatureTimeCourse import TemperatureTimeCourse
+from gasverbrauch import calc_intervals, faktor_kwh_per_m3, warmwasser_energy_per_day
+from LinearRegression import LinearRegression
+
+
+class ResultStore:
+    """
+    Persisted consumption table for incremental re-evaluation.
+
+    Every interval of the table is stored with a hash of its input row
+    (t0, t1, both meter readings and the conversion parameters) and a
+    fingerprint of the temperature samples under it. update() only
+    computes the mean temperature of intervals that are new, changed, or
+    whose temperature data changed (e.g. after a DWD correction), all
+    other rows are taken over from the store. The linear regression of
+    energy_per_day over temperatur (a LinearRegression, weighted by dt if
+    *weighted* is set) is kept up to date the same way, by removing dropped
+    rows and adding new rows.
+    """
+
+    def __init__(self, fn: str = './GasverbrauchKorrelationTemperatur.store.pkl', weighted: bool = False):
+        self.fn = fn
+        self.weighted = weighted
+        self.dfout = None
+        self.regression = LinearRegression()
+        self.reused = 0
+        self.computed = 0
+        if os.path.exists(fn):
+            stored = pd.read_pickle(fn)
+            self.dfout = stored['dfout']
+            if stored.get('weighted') == weighted:
+                self.regression = stored['regression']
+            else:
+                self.regression.add(*self.regression_data(self.dfout))
+
+    def row_hashes(dfout: pd.DataFrame, faktor_kwh_per_m3: float, warmwasser_energy_per_day: float) -> np.ndarray:
+        rows = dfout[['t0', 't1', 'zählerstand0', 'zählerstand1']].copy()
+        rows['faktor_kwh_per_m3'] = faktor_kwh_per_m3
+        rows['warmwasser_energy_per_day'] = warmwasser_energy_per_day
+        return pd.util.hash_pandas_object(rows, index=False).to_numpy()
+
+    def regression_data(self, dfout: pd.DataFrame) -> tuple:
+        return (dfout['temperatur'].to_numpy(), dfout['energy_per_day'].to_numpy(), dfout['dt'].to_numpy() if self.weighted else None)
+
+    def update(self, df: pd.DataFrame, station: TemperatureTimeCourse,
+               faktor_kwh_per_m3: float = faktor_kwh_per_m3, warmwasser_energy_per_day: float = warmwasser_energy_per_day) -> pd.DataFrame:
+        dfout = calc_intervals(df, faktor_kwh_per_m3, warmwasser_energy_per_day, station.ambiguous, station.nonexistent)
+        dfout['row_hash'] = ResultStore.row_hashes(dfout, faktor_kwh_per_m3, warmwasser_energy_per_day)
+        key0 = dfout['key0'].to_numpy()
+        key1 = dfout['key1'].to_numpy()
+        dfout['temp_hash'] = station.fingerprints(key0, key1) if len(dfout) > 0 else np.zeros(0, dtype=np.uint64)
+        # take over the temperature of rows stored with the same input and the same temperature data
+        reuse = np.zeros(len(dfout), dtype=bool)
+        if self.dfout is not None and len(self.dfout) > 0:
+            stored = self.dfout.drop_duplicates(['row_hash', 'temp_hash']).set_index(['row_hash', 'temp_hash'])['temperatur']
+            lookup = pd.MultiIndex.from_arrays([dfout['row_hash'], dfout['temp_hash']])
+            position = stored.index.get_indexer(lookup)
+            reuse = position >= 0
+            dfout.loc[reuse, 'temperatur'] = stored.to_numpy()[position[reuse]]
+        if not reuse.all():
+            dfout.loc[~reuse, 'temperatur'] = station.means_between_keys(key0[~reuse], key1[~reuse])
+        self.reused = int(reuse.sum())
+        self.computed = len(dfout) - self.reused
+        # regression: remove the rows that are gone from the store, add the ones that are new
+        if self.dfout is not None:
+            kept = pd.MultiIndex.from_arrays([self.dfout['row_hash'], self.dfout['temp_hash']]).isin(pd.MultiIndex.from_arrays([dfout['row_hash'], dfout['temp_hash']]))
+            self.regression.remove(*self.regression_data(self.dfout[~kept]))
+        self.regression.add(*self.regression_data(dfout[~reuse]))
+        self.dfout = dfout
+        self.save()
+        return dfout.drop(columns=['row_hash', 'temp_hash', 'key0', 'key1'])
+
+    def save(self):
+        fnpart = self.fn + '.part'
+        pd.to_pickle({'dfout': self.dfout, 'weighted': self.weighted, 'regression': self.regression}, fnpart)
+        os.replace(fnpart, self.fn)
@@ -0,0 +1,60 @@
+import numpy as np
+from matplotlib.colors import LogNorm
+from matplotlib.image import AxesImage
+
+
+class ScatterLOD:
+    """
+    Scatter plot with level of detail for large numbers of points.
+
+    As long as at most *threshold* points are inside the view limits they
+    are drawn as a regular scatter plot (only the visible ones). Above that
+    a binned density image of the visible points is drawn instead, with
+    *bins* x *bins* cells over the axes. Both are recomputed when the limits
+    change, so zooming in refines the density down to single points again.
+    Per-point sizes *s* are supported, all other scatter properties apply
+    to all points.
+    """
+
+    def __init__(self, ax, x, y, s=None, threshold: int = 20000, bins: int = 200, cmap='Reds', **scatter_kwargs):
+        self.ax = ax
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.s = None if s is None or np.ndim(s) == 0 else np.asarray(s, dtype=float)
+        self.threshold = threshold
+        self.bins = bins
+        # the scatter plot of all points determines the data limits for autoscaling
+        self.scatter = ax.scatter(self.x, self.y, s=s, **scatter_kwargs)
+        # the density image always covers the whole axes, in axes coordinates
+        self.image = AxesImage(ax, cmap=cmap, norm=LogNorm(), origin='lower', interpolation='nearest',
+                               extent=(0, 1, 0, 1), transform=ax.transAxes, visible=False)
+        ax.add_image(self.image)
+        self.view = None
+        ax.callbacks.connect('xlim_changed', self.refine)
+        ax.callbacks.connect('ylim_changed', self.refine)
+        self.refine()
+
+    def refine(self, *args):
+        view = tuple(self.ax.viewLim.bounds)
+        if view == self.view:
+            return
+        self.view = view
+        # axes coordinates, this covers log scales and inverted axes as well
+        points = (self.ax.transScale + self.ax.transLimits).transform(np.column_stack((self.x, self.y)))
+        visible = ((points >= 0) & (points <= 1)).all(axis=1)
+        n = int(visible.sum())
+        if n <= self.threshold:
+            self.scatter.set_offsets(np.column_stack((self.x[visible], self.y[visible])))
+            if self.s is not None:
+                self.scatter.set_sizes(self.s[visible])
+            self.scatter.set_visible(True)
+            self.image.set_visible(False)
+            return
+        (counts, _, _) = np.histogram2d(points[visible, 0], points[visible, 1], bins=self.bins, range=((0, 1), (0, 1)))
+        self.image.set_data(np.ma.masked_equal(counts.T, 0))
+        self.image.set_clim(1, max(counts.max(), 2))
+        self.image.set_visible(True)
+        self.scatter.set_visible(False)
+
+    def is_aggregated(self) -> bool:
+        return self.image.get_visible()
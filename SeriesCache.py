@@ -0,0 +1,74 @@
+import glob
+import hashlib
+import os
+import shutil
+import threading
+import numpy as np
+
+
+class SeriesCache:
+    """
+    Pre-parsed temperature series stored as plain .npy files.
+
+    A series is kept in *cache_dir*/<name>_<hash>/ with one file per column
+    (keys, temperatures, integral and optional quality columns). *hash* is
+    the digest of the source archive, so a changed archive is parsed again
+    while an unchanged one is memory-mapped read-only without parsing.
+    """
+
+    def __init__(self, cache_dir: str = os.path.join('dwdcache', 'series')):
+        self.cache_dir = cache_dir
+
+    def file_hash(fn: str, version: str = '') -> str:
+        # version is hashed along with the file, so series stored by an older parser are not reused
+        h = hashlib.sha256(version.encode())
+        with open(fn, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        return h.hexdigest()[:16]
+
+    def path(self, name: str, digest: str) -> str:
+        return os.path.join(self.cache_dir, f'{name}_{digest}')
+
+    def load(self, name: str, digest: str, columns: list) -> dict:
+        path = self.path(name, digest)
+        fns = {column: os.path.join(path, column + '.npy') for column in columns}
+        try:
+            return {column: np.load(fn, mmap_mode='r') for column, fn in fns.items()}
+        except FileNotFoundError:
+            # not stored yet, or just removed as stale by another writer: parse again
+            return None
+
+    def store(self, name: str, digest: str, arrays: dict):
+        path = self.path(name, digest)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmppath = f'{path}.{os.getpid()}.{threading.get_ident()}.part'
+        shutil.rmtree(tmppath, ignore_errors=True)
+        try:
+            os.makedirs(tmppath)
+            for column, values in arrays.items():
+                np.save(os.path.join(tmppath, column + '.npy'), values)
+            for attempt in range(3):
+                try:
+                    os.replace(tmppath, path)
+                    break
+                except OSError:
+                    # another writer stored the same series first (the directory is not replaced,
+                    # it may be memory-mapped), its files hold the same content; unless it was
+                    # removed as stale right away by a writer of another digest
+                    if os.path.isdir(path):
+                        break
+                    if attempt == 2:
+                        raise
+        finally:
+            shutil.rmtree(tmppath, ignore_errors=True)
+        # drop series parsed from earlier versions of the same archive
+        for stale in glob.glob(os.path.join(self.cache_dir, f'{name}_*')):
+            if stale != path and len(stale) == len(path) and os.path.isdir(stale):
+                # renamed first, so other processes see the whole series or none
+                trash = f'{stale}.{os.getpid()}.{threading.get_ident()}.part'
+                try:
+                    os.replace(stale, trash)
+                except OSError:
+                    continue
+                shutil.rmtree(trash, ignore_errors=True)
@@ -0,0 +1,88 @@
+import re
+import numpy as np
+import pandas as pd
+from TemperatureTimeCourse import TemperatureTimeCourse
+from bulkload import load_stations
+
+
+class StationRegistry:
+    """
+    Stations of the DWD hourly air temperature product with their positions.
+
+    Parses TU_Stundenwerte_Beschreibung_Stationen.txt (Latin-1). The widths
+    of the dashed header line do not match the data rows, so the numeric
+    columns are split at whitespace and station name and Bundesland at the
+    padding between them. Positions are kept as unit vectors, which turns
+    the k nearest stations into the k largest dot products, evaluated for
+    all (about 660) stations in one vectorized step.
+    """
+
+    earth_radius = 6371.0  # km
+    line_pattern = re.compile(r'^(\d+)\s+(\d{8})\s+(\d{8})\s+(-?\d+)\s+(-?[\d.]+)\s+(-?[\d.]+)\s+(.*?)\s{2,}(\S.*?)\s*$')
+
+    def __init__(self, fn: str = 'TU_Stundenwerte_Beschreibung_Stationen.txt'):
+        rows = []
+        with open(fn, 'r', encoding='latin-1') as f:
+            for line in f:
+                m = StationRegistry.line_pattern.match(line)
+                if m is not None:
+                    rows.append(m.groups())
+        self.stations = pd.DataFrame(rows, columns=['Stations_id', 'von_datum', 'bis_datum', 'Stationshoehe', 'geoBreite', 'geoLaenge', 'Stationsname', 'Bundesland'])
+        for column in ['von_datum', 'bis_datum']:
+            self.stations[column] = pd.to_datetime(self.stations[column], format='%Y%m%d')
+        self.stations['Stationshoehe'] = pd.to_numeric(self.stations['Stationshoehe'])
+        self.stations['geoBreite'] = pd.to_numeric(self.stations['geoBreite'])
+        self.stations['geoLaenge'] = pd.to_numeric(self.stations['geoLaenge'])
+        # stations reporting up to the date of the file are still active, their bis_datum is open ended
+        self.snapshot = self.stations['bis_datum'].max()
+        self.xyz = StationRegistry.to_xyz(self.stations['geoBreite'].values, self.stations['geoLaenge'].values)
+
+    def to_xyz(lat, lon) -> np.ndarray:
+        lat = np.radians(lat)
+        lon = np.radians(lon)
+        return np.stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)), axis=-1)
+
+    def active(self, t0=None, t1=None) -> np.ndarray:
+        von = self.stations['von_datum'].values
+        bis = self.stations['bis_datum'].values
+        open_ended = bis == np.datetime64(self.snapshot)
+        if t0 is None and t1 is None:
+            return open_ended
+        mask = np.ones(len(self.stations), dtype=bool)
+        if t0 is not None:
+            mask &= von <= np.datetime64(pd.Timestamp(t0))
+        if t1 is not None:
+            mask &= open_ended | (bis >= np.datetime64(pd.Timestamp(t1)))
+        return mask
+
+    def nearest(self, lat: float, lon: float, k: int = 5, t0=None, t1=None) -> pd.DataFrame:
+        # k nearest stations with data for the whole period t0..t1, currently active ones if no period is given
+        candidates = np.flatnonzero(self.active(t0, t1))
+        k = min(k, len(candidates))
+        assert k > 0
+        dot = self.xyz[candidates] @ StationRegistry.to_xyz(lat, lon)
+        best = np.argpartition(-dot, k-1)[:k]
+        best = best[np.argsort(-dot[best])]
+        ret = self.stations.iloc[candidates[best]].copy()
+        ret['distance'] = StationRegistry.earth_radius * np.arccos(np.clip(dot[best], -1.0, 1.0))
+        return ret
+
+    def blend(self, lat: float, lon: float, k: int = 3, t0=None, t1=None, power: float = 2.0, max_gap: int = 3 * 3600, **kwargs) -> TemperatureTimeCourse:
+        # inverse distance weighted course of the k nearest stations, kwargs are passed to load_stations
+        # a station contributes to an hour only if it has samples no more than max_gap seconds around it
+        near = self.nearest(lat, lon, k, t0, t1)
+        courses = list(load_stations(near['Stations_id'], **kwargs).values())
+        weights = 1.0 / np.maximum(near['distance'].values, 0.1) ** power
+        keys = np.unique(np.concatenate([course.keys for course in courses]))
+        num = np.zeros(len(keys))
+        den = np.zeros(len(keys))
+        for course, w in zip(courses, weights):
+            idx = course.search(keys, side='left')
+            exact = (idx < len(course.keys)) & (course.keys[np.minimum(idx, len(course.keys) - 1)] == keys)
+            inside = (idx > 0) & (idx < len(course.keys))
+            gap = course.keys[np.minimum(idx, len(course.keys) - 1)] - course.keys[np.maximum(idx - 1, 0)]
+            valid = exact | (inside & (gap <= max_gap))
+            num += np.where(valid, w * course.interpolate_keys(keys), 0.0)
+            den += np.where(valid, w, 0.0)
+        ok = den > 0
+        return TemperatureTimeCourse.from_series(keys[ok], num[ok] / den[ok], station='+'.join(near['Stations_id']))
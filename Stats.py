@@ -0,0 +1,78 @@
+import cProfile
+import io
+import pstats
+import time
+from contextlib import contextmanager, nullcontext
+
+
+class Stats:
+    """
+    Counters and phase timers for downloading, parsing and querying
+    temperature series.
+
+    Pass an instance as *stats* to TemperatureTimeCourse or DownloadCache
+    (or set getdwddata.stats) to collect per-phase wall times (download,
+    parse, convert_keys, ...), bytes downloaded, rows parsed and skipped,
+    query and interpolation counts and cache hits. Without a Stats object
+    the instrumented code only checks for None.
+
+    With *profile* set, cProfile runs during all (outermost) phases, see
+    print_profile(). *trace* is called as trace(kind, name, value) for
+    every finished phase ('phase', name, seconds) and counter update
+    ('count', name, n). An instance is not meant to be shared by threads.
+    """
+
+    def __init__(self, profile: bool = False, trace=None):
+        self.profiler = cProfile.Profile() if profile else None
+        self.trace = trace
+        self.reset()
+
+    def reset(self):
+        self.counters = {}
+        # name -> [total seconds, number of calls]
+        self.timers = {}
+        self.depth = 0
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+        if self.trace is not None:
+            self.trace('count', name, n)
+
+    @contextmanager
+    def phase(self, name: str):
+        if self.profiler is not None and self.depth == 0:
+            self.profiler.enable()
+        self.depth += 1
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - t0
+            self.depth -= 1
+            if self.profiler is not None and self.depth == 0:
+                self.profiler.disable()
+            timer = self.timers.setdefault(name, [0.0, 0])
+            timer[0] += seconds
+            timer[1] += 1
+            if self.trace is not None:
+                self.trace('phase', name, seconds)
+
+    def phase_of(stats: 'Stats', name: str):
+        # phase of an optional Stats object, a no-op context if stats is None
+        return stats.phase(name) if stats is not None else nullcontext()
+
+    def as_dict(self) -> dict:
+        return {'timers': {name: {'seconds': seconds, 'calls': calls} for name, (seconds, calls) in self.timers.items()},
+                'counters': dict(self.counters)}
+
+    def report(self) -> str:
+        lines = [f'{name:24} {seconds:10.4f} s {calls:8d} calls' for name, (seconds, calls) in self.timers.items()]
+        lines += [f'{name:24} {value:12d}' for name, value in self.counters.items()]
+        return '\n'.join(lines)
+
+    def print_profile(self, sort: str = 'cumulative', limit: int = 20) -> str:
+        assert self.profiler is not None, 'create Stats(profile=True) to profile'
+        out = io.StringIO()
+        pstats.Stats(self.profiler, stream=out).sort_stats(sort).print_stats(limit)
+        print(out.getvalue())
+        return out.getvalue()
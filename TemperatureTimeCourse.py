@@ -1,64 +1,370 @@
+import array
 import csv
 import io
+import os
+import re
 import zipfile
-import requests
+import numpy as np
 from datetime import date, datetime, time, timedelta
 from zoneinfo import ZoneInfo
-from sortedcontainers import SortedDict
+from DownloadCache import DownloadCache
+from SeriesCache import SeriesCache
+from QueryCache import QueryCache
+from Stats import Stats
 
 
-class TemperatureTimeCourse(SortedDict):
+class TemperatureTimeCourse:
 
     url0 = 'https://opendata.dwd.de/climate_environment/CDC/observations_germany/climate'
     basetime: datetime = datetime.fromisoformat('1992-01-01T00:00:00Z')
     utc = ZoneInfo('UTC')
     berlin = ZoneInfo('Europe/Berlin')
-    
-    def __init__(self, station: str = '13777'):  # by default use station Helmstedt-Emmerstedt
-        super().__init__()
-        urlhourly = f'/hourly/air_temperature/recent/stundenwerte_TU_{station}_akt.zip'
-        taghourly = 'produkt_tu_stunde_202'
-        outfnhourly = f'stundenwerte_TU_{station}_akt'
-        self.getdwddata(urlhourly, outfnhourly, taghourly)
-    
+    # optional per-sample columns besides the temperature: quality level and relative humidity (hourly / 10 minute product)
+    quality_columns = {'QN_9': np.int8, 'RF_TU': np.float32, 'QN': np.int8, 'RF_10': np.float32}
+    # DWD air temperature products per resolution: directory, archive name prefix, data file tag, temperature and
+    # quality columns; compact series store int32 keys and int16 tenths of a degree (a decade of 10 minute samples,
+    # ~526k, takes 2 MB keys, 1 MB temperatures and 4 MB integral instead of 12.6 MB); MESS_DATUM before mez_until
+    # is MEZ (UTC+1) instead of UTC, the 10 minute archives switched to UTC on 2000-01-01
+    products = {
+        'hourly': {'path': '/hourly/air_temperature/', 'archive': 'stundenwerte_TU_', 'tag': 'produkt_tu_stunde_',
+                   'temperature': 'TT_TU', 'quality': ['QN_9', 'RF_TU'], 'compact': False, 'mez_until': None},
+        '10min': {'path': '/10_minutes/air_temperature/', 'archive': '10minutenwerte_TU_', 'tag': 'produkt_zehn_min_tu_',
+                  'temperature': 'TT_10', 'quality': ['QN', 'RF_10'], 'compact': True, 'mez_until': '200001010000'},
+    }
+    # MESS_DATUM strings are converted to keys every parse_chunk rows while parsing, so they are never all held at once
+    parse_chunk = 1 << 16
+    # the historical archive is only republished about once a year
+    historical_max_age = 7 * 86400
+    # hashed with each archive in the series cache, bump it whenever parsing yields different series
+    # (2: MESS_DATUM is read as UTC, before it was taken as local time of the machine;
+    # 3: 10 minute MESS_DATUM before 2000 is read as MEZ)
+    series_version = '3'
+    # naive local times which occur twice (end of DST) or not at all (start of DST) are converted according to
+    # ambiguous: 'dst' (the first, summer time occurrence), 'standard' (the second one) or 'raise'
+    # nonexistent: 'backward' (one hour earlier in standard time), 'forward' (one hour later in summer time) or 'raise'
+    # the defaults give the same keys as datetime.astimezone on a machine running on Berlin time;
+    # set them on the class or on an instance
+    ambiguous = 'dst'
+    nonexistent = 'backward'
+
+    def __init__(self, station: str = '13777', with_quality: bool = False, cache: DownloadCache = None, series_cache: SeriesCache = None,
+                 historical: bool = True, lazy: bool = False, query_cache: QueryCache = None, stats: Stats = None,
+                 resolution: str = 'hourly'):  # by default use station Helmstedt-Emmerstedt
+        assert resolution in TemperatureTimeCourse.products, f'unknown resolution {resolution}'
+        self.station = station
+        self.with_quality = with_quality
+        self.resolution = resolution
+        # optional instrumentation (phase timers and counters), None costs only a check per call
+        self.stats = stats
+        # optional memo of point and interval query results, cleared whenever the series changes
+        self.query_cache = query_cache
+        self.cache = cache if cache is not None else DownloadCache(stats=stats)
+        self.series_cache = series_cache if series_cache is not None else SeriesCache(os.path.join(self.cache.cache_dir, 'series'))
+        product = TemperatureTimeCourse.products[resolution]
+        urlrecent = f'{product["path"]}recent/{product["archive"]}{station}_akt.zip'
+        urlhistorical = f'{product["path"]}historical/' if historical else None
+        self.source = (urlrecent, product['tag'], urlhistorical)
+        # with lazy set, download and parsing are postponed to the first access of the series (see __getattr__)
+        if not lazy:
+            self.load()
+
+    def from_series(keys, temperatures, station: str = None, quality: dict = None) -> 'TemperatureTimeCourse':
+        # instance on a series computed elsewhere (e.g. blended from several stations), without a DWD source
+        return TemperatureTimeCourse.from_arrays(TemperatureTimeCourse.sorted_series(keys, temperatures, quality), station)
+
+    def from_arrays(arrays: dict, station: str = None) -> 'TemperatureTimeCourse':
+        # instance on columns as returned by sorted_series or SeriesCache.load, used as they are (e.g. memory-mapped)
+        ttc = TemperatureTimeCourse.__new__(TemperatureTimeCourse)
+        ttc.station = station
+        ttc.with_quality = len(set(arrays) - {'keys', 'temperatures', 'integral'}) > 0
+        ttc.resolution = None
+        ttc.cache = None
+        ttc.series_cache = None
+        ttc.query_cache = None
+        ttc.stats = None
+        ttc.set_arrays(arrays)
+        return ttc
+
+    def load(self):
+        # columnar storage: sorted keys (seconds since basetime) and the temperatures belonging to them,
+        # integral holds the prefix sums of the trapezoid integral, integral[i] covers keys[0]..keys[i]
+        with Stats.phase_of(self.stats, 'load'):
+            self.getdwddata(*self.source)
+
+    def __getattr__(self, name: str):
+        # only called for attributes not set yet, i.e. the series of a lazy instance before its first use
+        if name in ('keys', 'temperatures', 'integral', 'quality', 'temperature_scale') and 'source' in self.__dict__:
+            self.load()
+            return self.__dict__[name]
+        raise AttributeError(name)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
     def measuring_time_to_key(datetimestr: str, tz: ZoneInfo) -> int:
-        t: datetime = datetime.strptime(datetimestr, '%Y%m%d%H').astimezone(tz)
+        t: datetime = TemperatureTimeCourse.localize(datetime.strptime(datetimestr, '%Y%m%d%H'), tz)
         dt: datetime.timedelta = t - TemperatureTimeCourse.basetime
         return int(dt.total_seconds())
-    
+
+    def mess_datum_to_keys(mess_datum) -> np.ndarray:
+        # vectorized measuring_time_to_key for a whole column of DWD MESS_DATUM strings (UTC),
+        # YYYYMMDDHH or YYYYMMDDHHMM, computed digit by digit with datetime64 arithmetic
+        n = len(mess_datum)
+        if n == 0:
+            return np.zeros(0, dtype=np.int64)
+        width = len(mess_datum[0])
+        assert width in (10, 12), f'unexpected MESS_DATUM {mess_datum[0]}'
+        if n > TemperatureTimeCourse.parse_chunk:
+            # chunk by chunk, the temporary columns stay small for long lists as well
+            keys = np.empty(n, dtype=np.int64)
+            for i in range(0, n, TemperatureTimeCourse.parse_chunk):
+                keys[i:i + TemperatureTimeCourse.parse_chunk] = TemperatureTimeCourse.mess_datum_to_keys(mess_datum[i:i + TemperatureTimeCourse.parse_chunk])
+            return keys
+        digits = np.frombuffer(''.join(mess_datum).encode('ascii'), dtype=np.uint8)
+        assert len(digits) == n * width, 'MESS_DATUM values of different length'
+        digits = digits.reshape(n, width)
+
+        def number(i0: int, i1: int) -> np.ndarray:
+            # int32 column by column on the uint8 characters, no integer matrix of all digits
+            value = np.zeros(n, dtype=np.int32)
+            for i in range(i0, i1):
+                # characters below '0' wrap around to large values
+                digit = digits[:, i] - np.uint8(ord('0'))
+                assert np.all(digit <= 9), 'MESS_DATUM with non-digits'
+                value *= 10
+                value += digit
+            return value
+        (month, day, hour) = (number(4, 6), number(6, 8), number(8, 10))
+        minute = number(10, 12) if width == 12 else 0
+        months = ((number(0, 4) - 1970) * 12 + month - 1).astype('datetime64[M]')
+        days = months.astype('datetime64[D]') + (day - 1)
+        assert np.all((month >= 1) & (month <= 12) & (day >= 1) & (days.astype('datetime64[M]') == months) & (hour < 24) & (minute < 60)), 'invalid MESS_DATUM'
+        seconds = days.astype(np.int64) * 86400 + hour * 3600 + minute * 60
+        return seconds - int(TemperatureTimeCourse.basetime.timestamp())
+
+    def localize(t: datetime, tz: ZoneInfo = None, ambiguous: str = None, nonexistent: str = None) -> datetime:
+        # naive local time in tz (default Europe/Berlin) as aware datetime, DST transitions resolved by the given
+        # policies (defaults: TemperatureTimeCourse.ambiguous / .nonexistent), independent of the machine time zone
+        tz = tz if tz is not None else TemperatureTimeCourse.berlin
+        ambiguous = ambiguous if ambiguous is not None else TemperatureTimeCourse.ambiguous
+        nonexistent = nonexistent if nonexistent is not None else TemperatureTimeCourse.nonexistent
+        assert ambiguous in ('dst', 'standard', 'raise') and nonexistent in ('backward', 'forward', 'raise')
+        t0 = t.replace(tzinfo=tz, fold=0)
+        t1 = t.replace(tzinfo=tz, fold=1)
+        if t0.utcoffset() == t1.utcoffset():
+            return t0
+        # a time in the gap does not survive the round trip through UTC, an ambiguous one does
+        nonexisting = t0.astimezone(TemperatureTimeCourse.utc).astimezone(tz).replace(tzinfo=None) != t
+        policy = nonexistent if nonexisting else ambiguous
+        if policy == 'raise':
+            raise ValueError(f'{"non-existent" if nonexisting else "ambiguous"} local time {t} in {tz}')
+        # fold=0 applies the offset before the transition
+        return t0 if policy in ('dst', 'forward') else t1
+
     def datetime_to_key(t: datetime) -> int:
         key = int((t - TemperatureTimeCourse.basetime).total_seconds())
         return key
-    
-    def get(self, key) -> float:
-        temp: float = float(self[key]['TT_TU'])
-        return temp
 
-    def getdwddata(self, urlpath, outfn, tag):
-        r = requests.get(TemperatureTimeCourse.url0 + urlpath)
-        assert r.ok
-        with open(outfn + '.zip', 'wb') as outf:
-            outf.write(r.content)
-        with io.BytesIO(r.content) as f:
-            with zipfile.ZipFile(f, 'r') as z:
-                zdir = z.namelist()
-                matches = [match for match in zdir if tag in match]
-                assert len(matches) == 1
-                with z.open(matches[0]) as zf:
-                    raw_data = zf.read()
-                    with open(outfn + '.csv', 'wb') as f2:
-                        f2.write(raw_data)
-                    with io.TextIOWrapper(io.BytesIO(raw_data), newline='') as f3:
-                        reader = csv.reader(f3, delimiter=';')
-                        headers = next(reader)
-                        assert 'MESS_DATUM' in headers
-                        assert 'TT_TU' in headers
-                        for row in reader:
-                            entry = {key: value for key, value in zip(headers, row)}
-                            tt_tu: float = float(entry['TT_TU'])
-                            if tt_tu != -999:
-                                dti: int = TemperatureTimeCourse.measuring_time_to_key(entry['MESS_DATUM'], tz=TemperatureTimeCourse.utc)
-                                self[dti] = entry
+    def datetimes_to_utc(t, ambiguous: str = None, nonexistent: str = None):
+        # vectorized localize, naive timestamps are taken as Europe/Berlin local time, returns a UTC DatetimeIndex
+        import pandas as pd
+        ambiguous = ambiguous if ambiguous is not None else TemperatureTimeCourse.ambiguous
+        nonexistent = nonexistent if nonexistent is not None else TemperatureTimeCourse.nonexistent
+        try:
+            t = pd.DatetimeIndex(pd.to_datetime(t))
+        except ValueError:
+            # offsets changing with DST (e.g. +02:00 and +01:00) are no single time zone
+            t = pd.DatetimeIndex(pd.to_datetime(t, utc=True))
+        if t.tz is None:
+            t = t.tz_localize(TemperatureTimeCourse.berlin,
+                              ambiguous={'dst': np.ones(len(t), dtype=bool), 'standard': np.zeros(len(t), dtype=bool), 'raise': 'raise'}[ambiguous],
+                              nonexistent={'backward': pd.Timedelta(hours=-1), 'forward': pd.Timedelta(hours=1), 'raise': 'raise'}[nonexistent])
+        return t.tz_convert(TemperatureTimeCourse.utc)
+
+    def datetimes_to_keys(t, ambiguous: str = None, nonexistent: str = None) -> np.ndarray:
+        # vectorized datetime_to_key, naive timestamps are taken as Europe/Berlin local time (see localize)
+        t = TemperatureTimeCourse.datetimes_to_utc(t, ambiguous, nonexistent)
+        seconds = t.tz_localize(None).values.astype('datetime64[s]').astype(np.int64)
+        return seconds - int(TemperatureTimeCourse.basetime.timestamp())
+
+    def get(self, key: int) -> float:
+        if self.stats is not None:
+            self.stats.count('point_queries')
+        idx = int(self.search(key))
+        if idx < len(self.keys) and self.keys[idx] == key:
+            return float(self.temperatures[idx]) / self.temperature_scale
+        return self.interpolate(key)
+
+    def search(self, t_keys, side: str = 'left'):
+        # searchsorted in the dtype of keys, compact int32 keys would otherwise be converted to int64 on every call
+        if self.keys.dtype == np.int32:
+            if np.ndim(t_keys) == 0:
+                t_keys = np.int32(min(max(int(t_keys), -2**31), 2**31 - 1))
+            else:
+                t_keys = np.clip(t_keys, -2**31, 2**31 - 1).astype(np.int32)
+        return np.searchsorted(self.keys, t_keys, side=side)
+
+    def compact_scale(temperatures: np.ndarray) -> int:
+        # stored temperatures are degrees times this scale: compact int16 temperatures are tenths of a degree
+        return 10 if temperatures.dtype == np.int16 else 1
+
+    def sorted_series(keys, temperatures, quality: dict = None, compact: bool = False) -> dict:
+        keys = np.asarray(keys, dtype=np.int64)
+        temperatures = np.asarray(temperatures, dtype=np.float64)
+        assert len(keys) == len(temperatures)
+        columns = {'keys': keys, 'temperatures': temperatures}
+        if quality is not None:
+            for name, column in quality.items():
+                columns[name] = np.asarray(column, dtype=TemperatureTimeCourse.quality_columns[name])
+        # DWD files are sorted already, only reorder (and copy) if necessary
+        if not np.all(keys[1:] > keys[:-1]):
+            order = np.argsort(keys, kind='stable')
+            keys = keys[order]
+            # on duplicate keys the last sample wins, as it did for repeated dict assignment
+            keep = order[np.append(keys[1:] != keys[:-1], True)]
+            columns = {name: column[keep] for name, column in columns.items()}
+        if compact:
+            # int32 seconds since basetime cover 1924..2060, int16 tenths of a degree +-3276.7
+            assert len(keys) == 0 or (columns['keys'][0] >= -2**31 and columns['keys'][-1] < 2**31)
+            columns['keys'] = columns['keys'].astype(np.int32)
+            columns['temperatures'] = np.round(columns['temperatures'] * 10).astype(np.int16)
+        columns['integral'] = TemperatureTimeCourse.cumulative_integral(columns['keys'], columns['temperatures'] / TemperatureTimeCourse.compact_scale(columns['temperatures']))
+        return columns
+
+    def cumulative_integral(keys: np.ndarray, temperatures: np.ndarray) -> np.ndarray:
+        areas = (temperatures[1:] + temperatures[:-1]) / 2 * np.diff(keys.astype(np.int64))
+        return np.concatenate(([0.0], np.cumsum(areas)))
+
+    def set_arrays(self, arrays: dict):
+        arrays = dict(arrays)
+        self.keys = arrays.pop('keys')
+        self.temperatures = arrays.pop('temperatures')
+        self.integral = arrays.pop('integral')
+        self.temperature_scale = TemperatureTimeCourse.compact_scale(self.temperatures)
+        self.quality = arrays
+        self.__dict__.pop('sample_hashes', None)
+        self.__dict__.pop('aggregate_pyramid', None)
+        if self.query_cache is not None:
+            self.query_cache.clear()
+
+    def set_series(self, keys, temperatures, quality: dict = None):
+        self.set_arrays(TemperatureTimeCourse.sorted_series(keys, temperatures, quality))
+
+    def build_index(self):
+        self.integral = TemperatureTimeCourse.cumulative_integral(self.keys, self.temperatures / self.temperature_scale)
+
+    def append_series(self, keys, temperatures, quality: dict = None):
+        # samples from keys[0] on replace the stored ones, the integral index is only extended for the new part
+        new = TemperatureTimeCourse.sorted_series(keys, temperatures, quality, compact=self.temperature_scale != 1)
+        if len(new['keys']) == 0:
+            return
+        n = int(self.search(new['keys'][0], side='left'))
+        if n == 0:
+            self.set_arrays(new)
+            return
+        arrays = {'keys': np.concatenate((self.keys[:n], new['keys'])),
+                  'temperatures': np.concatenate((self.temperatures[:n], new['temperatures']))}
+        tail = TemperatureTimeCourse.cumulative_integral(arrays['keys'][n-1:], arrays['temperatures'][n-1:] / self.temperature_scale)
+        arrays['integral'] = np.concatenate((self.integral[:n], self.integral[n-1] + tail[1:]))
+        for name, column in self.quality.items():
+            if name in new:
+                arrays[name] = np.concatenate((column[:n], new[name]))
+        self.set_arrays(arrays)
+
+    def append_arrays(self, arrays: dict, select=slice(None)):
+        # append_series for (a selection of) a series as returned by load_archive
+        self.append_series(arrays['keys'][select], arrays['temperatures'][select] / TemperatureTimeCourse.compact_scale(arrays['temperatures']),
+                           {name: arrays[name][select] for name in TemperatureTimeCourse.quality_columns if name in arrays})
+
+    def load_archive(self, url: str, tag: str, max_age: float = None) -> dict:
+        with Stats.phase_of(self.stats, 'fetch'):
+            fn = self.cache.fetch(url, max_age=max_age)
+        # reuse the series parsed earlier from exactly this archive
+        with Stats.phase_of(self.stats, 'series_cache_load'):
+            name = os.path.splitext(os.path.basename(fn))[0]
+            digest = SeriesCache.file_hash(fn, TemperatureTimeCourse.series_version)
+            product = TemperatureTimeCourse.products[self.resolution]
+            columns = ['keys', 'temperatures', 'integral'] + (product['quality'] if self.with_quality else [])
+            arrays = self.series_cache.load(name, digest, columns)
+        if self.stats is not None:
+            self.stats.count('series_cache_hits' if arrays is not None else 'series_cache_misses')
+        if arrays is not None:
+            return arrays
+        with Stats.phase_of(self.stats, 'parse'), zipfile.ZipFile(fn, 'r') as z:
+            zdir = z.namelist()
+            matches = [match for match in zdir if tag in match]
+            assert len(matches) == 1
+            # parse straight from the decompressing member stream into compact typed arrays
+            with z.open(matches[0]) as zf, io.TextIOWrapper(zf, encoding='latin-1', newline='') as f3:
+                reader = csv.reader(f3, delimiter=';')
+                # the 10 minute product pads its column names, e.g. '  QN'
+                headers = [header.strip() for header in next(reader)]
+                assert 'MESS_DATUM' in headers
+                assert product['temperature'] in headers
+                i_mess_datum = headers.index('MESS_DATUM')
+                i_tt_tu = headers.index(product['temperature'])
+                i_quality = {column: headers.index(column) for column in product['quality'] if self.with_quality and column in headers}
+                mess_datum = []
+                keys = array.array('q')
+                temperatures = array.array('d')
+                quality = {column: array.array('d') for column in i_quality}
+                skipped = 0
+                for row in reader:
+                    tt_tu: float = float(row[i_tt_tu])
+                    if tt_tu != -999:
+                        mess_datum.append(row[i_mess_datum])
+                        temperatures.append(tt_tu)
+                        for column, i in i_quality.items():
+                            quality[column].append(float(row[i]))
+                        if len(mess_datum) == TemperatureTimeCourse.parse_chunk:
+                            self.convert_mess_datum(mess_datum, keys)
+                    else:
+                        skipped += 1
+                self.convert_mess_datum(mess_datum, keys)
+        if self.stats is not None:
+            self.stats.count('rows_parsed', len(keys) + skipped)
+            self.stats.count('rows_skipped', skipped)
+        with Stats.phase_of(self.stats, 'sort_index'):
+            arrays = TemperatureTimeCourse.sorted_series(keys, temperatures, quality if self.with_quality else None, compact=product['compact'])
+        with Stats.phase_of(self.stats, 'series_cache_store'):
+            self.series_cache.store(name, digest, arrays)
+        return arrays
+
+    def convert_mess_datum(self, mess_datum: list, keys: array.array):
+        # appends the keys of the collected MESS_DATUM strings and empties the list
+        with Stats.phase_of(self.stats, 'convert_keys'):
+            converted = TemperatureTimeCourse.mess_datum_to_keys(mess_datum)
+            mez_until = TemperatureTimeCourse.products[self.resolution]['mez_until']
+            if mez_until is not None:
+                converted[converted < TemperatureTimeCourse.mess_datum_to_keys([mez_until])[0]] -= 3600
+            keys.frombytes(converted.tobytes())
+        mess_datum.clear()
+
+    def find_historical(self, urlpath: str) -> list:
+        # the names of the historical archives contain their date ranges, so look them up in the directory listing;
+        # the 10 minute product is split into several archives, sorted by name they are in chronological order
+        fn = self.cache.fetch(TemperatureTimeCourse.url0 + urlpath, name=urlpath.strip('/').replace('/', '_') + '.html', max_age=TemperatureTimeCourse.historical_max_age)
+        with open(fn, 'r', encoding='latin-1') as f:
+            listing = f.read()
+        archive = TemperatureTimeCourse.products[self.resolution]['archive']
+        matches = sorted(set(re.findall(rf'{archive}{self.station}_\d{{8}}_\d{{8}}_hist\.zip', listing)))
+        return [urlpath + match for match in matches]
+
+    def getdwddata(self, urlpath, tag, urlpath_historical: str = None):
+        recent = self.load_archive(TemperatureTimeCourse.url0 + urlpath, tag)
+        urlhists = self.find_historical(urlpath_historical) if urlpath_historical is not None else []
+        if len(urlhists) == 0:
+            self.set_arrays(recent)
+            return
+        # historical data is quality controlled and wins where both overlap, recent data only extends it;
+        # a later historical archive replaces the earlier ones from its first sample on
+        for i, urlhist in enumerate(urlhists):
+            arrays = self.load_archive(TemperatureTimeCourse.url0 + urlhist, tag, max_age=TemperatureTimeCourse.historical_max_age)
+            if i == 0:
+                self.set_arrays(arrays)
+            else:
+                self.append_arrays(arrays)
+        self.append_arrays(recent, recent['keys'] > self.keys[-1])
 
     def idx_neighbourhood(self, idx: int) -> (int,int):
         if idx == 0:
@@ -69,58 +375,145 @@ class TemperatureTimeCourse(SortedDict):
             ret = (idx-1, idx) # interpolate
         return ret
 
-    def __missing__(self, t_key: int):
-        idx = self.bisect(t_key)
+    def interpolate(self, t_key: int) -> float:
+        if self.stats is not None:
+            self.stats.count('interpolations')
+        idx = int(self.search(t_key, side='right'))
         (idx0, idx1) = self.idx_neighbourhood(idx)
-        t1 = self.bisect_right(t_key)
-        (t0, f0) = self.peekitem(idx0)
-        (t1, f1) = self.peekitem(idx1)
-        temp0 = float(f0['TT_TU'])
-        temp1 = float(f1['TT_TU'])
+        t0 = int(self.keys[idx0])
+        t1 = int(self.keys[idx1])
+        temp0 = float(self.temperatures[idx0]) / self.temperature_scale
+        temp1 = float(self.temperatures[idx1]) / self.temperature_scale
         value = temp0 + ((temp1-temp0)/(t1-t0))*(t_key-t0)
-        entry = { 'TT_TU': str(value) }
-        self[t_key] = entry
-        return entry
-    
+        return value
+
+    def interpolate_keys(self, t_keys: np.ndarray) -> np.ndarray:
+        # vectorized interpolate, clipping the neighbourhood reproduces idx_neighbourhood
+        if self.stats is not None:
+            self.stats.count('interpolations', len(t_keys))
+        idx0 = np.clip(self.search(t_keys, side='right') - 1, 0, len(self.keys) - 2)
+        t0 = self.keys[idx0]
+        temp0 = self.temperatures[idx0] / self.temperature_scale
+        temp1 = self.temperatures[idx0 + 1] / self.temperature_scale
+        return temp0 + ((temp1 - temp0) / (self.keys[idx0 + 1] - t0)) * (t_keys - t0)
+
     def assure_awareness(self, t: datetime) -> datetime:
-        if t.tzinfo is None or t.tzinfo.utcoffset(None) is None:
-            t_ret = t.astimezone(TemperatureTimeCourse.berlin)
+        if t.utcoffset() is None:
+            t_ret = TemperatureTimeCourse.localize(t, TemperatureTimeCourse.berlin, self.ambiguous, self.nonexistent)
         else:
             t_ret = t
         return t_ret
-    
-    def calc_mean_temperature(self, t0: datetime, t1: datetime) -> int:
+
+    def integrate(self, t_key: int) -> float:
+        # integral of the piecewise linear course from keys[0] to t_key, extrapolated beyond both ends
+        idx = int(self.search(t_key, side='right'))
+        (idx0, idx1) = self.idx_neighbourhood(idx)
+        t0 = int(self.keys[idx0])
+        temp0 = float(self.temperatures[idx0]) / self.temperature_scale
+        temp = self.interpolate(t_key)
+        return float(self.integral[idx0]) + ((temp0 + temp) / 2) * (t_key - t0)
+
+    def calc_mean_temperature(self, t0: datetime, t1: datetime) -> float:
         assert t1 > t0
         t0_aware = self.assure_awareness(t0)
         t1_aware = self.assure_awareness(t1)
-        # ensure that start and end timestamp are in the dictionary
         key0 = TemperatureTimeCourse.datetime_to_key(t0_aware)
         key1 = TemperatureTimeCourse.datetime_to_key(t1_aware)
-        entry0 = self[key0]
-        entry1 = self[key1]
-        # iterate and integrate
-        sum: float = 0.0
-        it = self.irange(key0, key1)
-        k0 = next(it)
-        for k in it:
-            temp0 = self.get(k0)
-            temp1 = self.get(k)
-            sum += ((temp1 + temp0) / 2) * (k - k0)
-            k0 = k
+        if self.stats is not None:
+            self.stats.count('mean_queries')
+        if self.query_cache is not None:
+            return self.cached_query(('mean', key0, key1), lambda: self.mean_between_keys(key0, key1))
+        return self.mean_between_keys(key0, key1)
+
+    def cached_query(self, key: tuple, compute):
+        if self.stats is None:
+            return self.query_cache.get(key, compute)
+        hits = self.query_cache.hits
+        value = self.query_cache.get(key, compute)
+        self.stats.count('query_cache_hits', self.query_cache.hits - hits)
+        return value
+
+    def mean_between_keys(self, key0: int, key1: int) -> float:
+        # trapezoid integral between both keys taken from the prefix sums
+        sum: float = self.integrate(key1) - self.integrate(key0)
         # calc mean and return
         return sum / (key1 - key0)
-    
-    def calc_day_mean_temperature(self, d: date, tz = None) -> int:
+
+    def integrate_keys(self, t_keys: np.ndarray) -> np.ndarray:
+        idx0 = np.clip(self.search(t_keys, side='right') - 1, 0, len(self.keys) - 2)
+        temp = self.interpolate_keys(t_keys)
+        return self.integral[idx0] + ((self.temperatures[idx0] / self.temperature_scale + temp) / 2) * (t_keys - self.keys[idx0])
+
+    def calc_mean_temperatures(self, t0, t1) -> np.ndarray:
+        # batch version of calc_mean_temperature for arrays / pandas series of interval boundaries
+        with Stats.phase_of(self.stats, 'convert_keys'):
+            key0 = TemperatureTimeCourse.datetimes_to_keys(t0, self.ambiguous, self.nonexistent)
+            key1 = TemperatureTimeCourse.datetimes_to_keys(t1, self.ambiguous, self.nonexistent)
+        return self.means_between_keys(key0, key1)
+
+    def means_between_keys(self, key0: np.ndarray, key1: np.ndarray) -> np.ndarray:
+        key0 = np.asarray(key0, dtype=np.int64)
+        key1 = np.asarray(key1, dtype=np.int64)
+        assert len(key0) == len(key1)
+        assert np.all(key1 > key0)
+        if self.stats is not None:
+            self.stats.count('mean_queries', len(key0))
+        with Stats.phase_of(self.stats, 'integrate'):
+            return (self.integrate_keys(key1) - self.integrate_keys(key0)) / (key1 - key0)
+
+    def fingerprints(self, t_keys0: np.ndarray, t_keys1: np.ndarray) -> np.ndarray:
+        # per interval a 64 bit digest of all samples its mean depends on (including the neighbours used at the boundaries),
+        # taken from prefix sums of per-sample hashes, so it changes whenever one of these samples changes
+        if 'sample_hashes' not in self.__dict__:
+            with np.errstate(over='ignore'):
+                h = self.keys.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15) ^ (self.temperatures / self.temperature_scale).view(np.uint64)
+                h ^= h >> np.uint64(31)
+                h *= np.uint64(0xBF58476D1CE4E5B9)
+                h ^= h >> np.uint64(29)
+                self.sample_hashes = np.concatenate((np.zeros(1, dtype=np.uint64), np.cumsum(h, dtype=np.uint64)))
+        n = len(self.keys)
+        i0 = np.clip(self.search(t_keys0, side='right') - 1, 0, n - 2)
+        i1 = np.clip(self.search(t_keys1, side='left'), 1, n - 1)
+        with np.errstate(over='ignore'):
+            return (self.sample_hashes[i1 + 1] - self.sample_hashes[i0]) ^ (i1 - i0).astype(np.uint64)
+
+    def aggregates(self) -> 'Aggregates':
+        # day / month / year aggregates in the Berlin calendar (see Aggregates.py), built on first use
+        # and dropped together with the series
+        if 'aggregate_pyramid' not in self.__dict__:
+            from Aggregates import Aggregates
+            self.aggregate_pyramid = Aggregates(self)
+        return self.aggregate_pyramid
+
+    def calc_day_mean_temperature(self, d: date, tz = None) -> float:
         if tz is None:
             tz = TemperatureTimeCourse.berlin
+        if tz == TemperatureTimeCourse.berlin:
+            aggregate = self.aggregates().day(d)
+            if aggregate is not None:
+                return aggregate['mean']
         t0 = datetime.combine(d, time(0,0), tz)
         d1 = d + timedelta(days=1)
         t1 = datetime.combine(d1, time(0,0), tz)
         temp = self.calc_mean_temperature(t0, t1)
         return temp
-    
+
+    def calc_month_mean_temperature(self, year: int, month: int) -> float:
+        aggregate = self.aggregates().month(year, month)
+        if aggregate is not None:
+            return aggregate['mean']
+        return self.calc_mean_temperature(datetime(year, month, 1), datetime(year + (month == 12), month % 12 + 1, 1))
+
+    def calc_year_mean_temperature(self, year: int) -> float:
+        aggregate = self.aggregates().year(year)
+        if aggregate is not None:
+            return aggregate['mean']
+        return self.calc_mean_temperature(datetime(year, 1, 1), datetime(year + 1, 1, 1))
+
     def calc_temperature(self, t: datetime) -> float:
         t_aware = self.assure_awareness(t)
-        temp = float(self[TemperatureTimeCourse.datetime_to_key(t_aware)]['TT_TU'])
+        key = TemperatureTimeCourse.datetime_to_key(t_aware)
+        if self.query_cache is not None:
+            return self.cached_query(('point', key), lambda: self.get(key))
+        temp = self.get(key)
         return temp
-    
\ No newline at end of file
@@ -1,9 +1,9 @@
 # %%
 from TemperatureTimeCourse import TemperatureTimeCourse
+from gasverbrauch import read_readings, calc_consumption
 
 # %%
 from datetime import date, time, datetime, timedelta
-import pandas as pd
 import numpy as np
 
 # %%
@@ -18,32 +18,14 @@ print(f'{station13777.calc_day_mean_temperature(yesterday()):5.2f} °C')
 
 # %%
 xls_fn : str = './Ablesung-Gas.xlsx'
-df = pd.read_excel(xls_fn, sheet_name='Sheet1', engine='openpyxl', dtype='string')
+df = read_readings(xls_fn)
 
 # %%
 faktor_kwh_per_m3 = 9.82
 warmwasser_energy_per_day = 0.60 * faktor_kwh_per_m3
-data = {'t0':[], 't1':[], 'dt':[], 'zählerstand0':[], 'zählerstand1':[], 'verbrauch':[], 'temperatur':[], 'energy_per_day':[]}
-for i in range(1,len(df)):
-    if pd.notna(df.iloc[i]['Bemerkung']):
-        print(f'Skip: i={i}, Bemerkung={df.iloc[i]["Bemerkung"]}')
-    else:
-        t0 = datetime.strptime(df.iloc[i-1]["Ablesezeitpunkt"], "%Y-%m-%d %H:%M:%S")
-        t1 = datetime.strptime(df.iloc[i]["Ablesezeitpunkt"], "%Y-%m-%d %H:%M:%S")
-        z0 = float(df.iloc[i-1]["Zählerstand"])
-        z1 = float(df.iloc[i]["Zählerstand"])
-        dt : timedelta = t1-t0
-        temperature = station13777.calc_mean_temperature(t0, t1)
-        energieverbrauch_per_day = (z1-z0) * faktor_kwh_per_m3 * 86400 / dt.total_seconds() - warmwasser_energy_per_day
-        data['t0'].append(t0)
-        data['t1'].append(t1)
-        data['dt'].append(dt.total_seconds()/86400)
-        data['zählerstand0'].append(z0)
-        data['zählerstand1'].append(z1)
-        data['verbrauch'].append(z1-z0)
-        data['temperatur'].append(temperature)
-        data['energy_per_day'].append(energieverbrauch_per_day)
-dfout = pd.DataFrame(data)
+for i in df.index[df['Bemerkung'].notna()]:
+    print(f'Skip: i={i}, Bemerkung={df.loc[i, "Bemerkung"]}')
+dfout = calc_consumption(df, station13777, faktor_kwh_per_m3, warmwasser_energy_per_day)
 
 # %%
 dfout
@@ -0,0 +1,134 @@
+import argparse
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from DownloadCache import DownloadCache
+from SeriesCache import SeriesCache
+from TemperatureTimeCourse import TemperatureTimeCourse
+from bulkload import load_stations
+from gasverbrauch import read_readings, calc_consumption
+from PulseLog import PulseLog
+from LinearRegression import LinearRegression
+from changepoint import fit_changepoint
+
+# Evaluates many meters in parallel worker processes. The manifest (CSV or
+# xlsx) has one row per meter:
+#
+#     name;readings;station;faktor_kwh_per_m3;warmwasser_energy_per_day
+#     Haus A;./Ablesung-Gas.xlsx;13777;9.82;5.892
+#     Haus B;./Gaszaehler.csv;00662;10.1;6.06
+#
+# readings is an Excel file like Ablesung-Gas.xlsx or a pulse reader log
+# (.csv, see PulseLog.py, optional columns interval and m3_per_count).
+# Without warmwasser_energy_per_day 0.60 m³/day are assumed. Every station
+# is loaded once in this process and stored as .npy columns (SeriesCache),
+# the workers memory-map these files read-only instead of receiving pickled
+# series, so all of them share one copy in the page cache.
+#
+#     python batch.py manifest.csv --out results.csv --regressions regressions.csv
+
+courses = {}  # station -> TemperatureTimeCourse on the shared series, set in every worker by init_worker
+
+
+def read_manifest(fn: str) -> pd.DataFrame:
+    if fn.lower().endswith('.xlsx'):
+        df = pd.read_excel(fn, engine='openpyxl', dtype={'station': str})
+    else:
+        df = pd.read_csv(fn, sep=None, engine='python', dtype={'station': str})
+    assert {'readings', 'station', 'faktor_kwh_per_m3'} <= set(df.columns), f'{fn}: readings, station and faktor_kwh_per_m3 are required'
+    df['station'] = df['station'].str.strip().str.zfill(5)
+    # reading files are relative to the manifest
+    df['readings'] = [os.path.join(os.path.dirname(os.path.abspath(fn)), readings) for readings in df['readings']]
+    if 'name' not in df:
+        df['name'] = [os.path.basename(readings) for readings in df['readings']]
+    if 'warmwasser_energy_per_day' not in df:
+        df['warmwasser_energy_per_day'] = 0.60 * df['faktor_kwh_per_m3']
+    return df
+
+
+def share_series(course: TemperatureTimeCourse, series_cache: SeriesCache) -> tuple:
+    # the merged series of a station stored under a digest of its content, returns the arguments for SeriesCache.load
+    arrays = {'keys': course.keys, 'temperatures': course.temperatures, 'integral': course.integral}
+    h = hashlib.sha256(TemperatureTimeCourse.series_version.encode())
+    for values in arrays.values():
+        h.update(np.ascontiguousarray(values).tobytes())
+    (name, digest) = (f'station_{course.station}', h.hexdigest()[:16])
+    if series_cache.load(name, digest, list(arrays)) is None:
+        series_cache.store(name, digest, arrays)
+    return (series_cache.cache_dir, name, digest, list(arrays))
+
+
+def init_worker(shared: dict):
+    for station, (cache_dir, name, digest, columns) in shared.items():
+        courses[station] = TemperatureTimeCourse.from_arrays(SeriesCache(cache_dir).load(name, digest, columns), station)
+
+
+def evaluate(meter: dict) -> tuple:
+    # consumption table and regressions of one meter, runs in a worker
+    if meter['readings'].lower().endswith('.csv'):
+        interval = meter.get('interval')
+        m3_per_count = meter.get('m3_per_count')
+        df = PulseLog.read(meter['readings'], interval=interval if isinstance(interval, str) else '1D',
+                           m3_per_count=m3_per_count if pd.notna(m3_per_count) else 1.0)
+    else:
+        df = read_readings(meter['readings'])
+    dfout = calc_consumption(df, courses[meter['station']], meter['faktor_kwh_per_m3'], meter['warmwasser_energy_per_day'])
+    dfout.insert(0, 'name', meter['name'])
+    dfout.insert(1, 'station', meter['station'])
+    result = {'name': meter['name'], 'station': meter['station'], 'intervals': len(dfout)}
+    if len(dfout) >= 3:
+        regression = LinearRegression()
+        regression.add(dfout['temperatur'], dfout['energy_per_day'])
+        result.update(regression.fit())
+        changepoint = fit_changepoint(dfout['temperatur'], dfout['energy_per_day'])
+        result.update({'tb': changepoint['tb'], 'a_cp': changepoint['a'], 'b_cp': changepoint['b'], 'R**2_cp': changepoint['R**2']})
+    return (dfout, result)
+
+
+def run_batch(manifest: pd.DataFrame, max_workers: int = None, cache: DownloadCache = None, **kwargs) -> (pd.DataFrame, pd.DataFrame):
+    # kwargs are passed to TemperatureTimeCourse (via load_stations), returns the combined table and one regression row per meter
+    cache = cache if cache is not None else DownloadCache()
+    series_cache = SeriesCache(os.path.join(cache.cache_dir, 'series'))
+    stations = load_stations(manifest['station'].unique(), cache=cache, **kwargs)
+    shared = {station: share_series(course, series_cache) for station, course in stations.items()}
+    del stations
+    meters = manifest.to_dict('records')
+    tables = []
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker, initargs=(shared,)) as executor:
+        futures = [executor.submit(evaluate, meter) for meter in meters]
+        for meter, future in zip(meters, futures):
+            try:
+                (dfout, result) = future.result()
+            except Exception as e:
+                # one broken reading file does not stop the others
+                print(f'{meter["name"]}: {e!r}')
+                results.append({'name': meter['name'], 'station': meter['station'], 'intervals': 0, 'error': repr(e)})
+                continue
+            tables.append(dfout)
+            results.append(result)
+    return (pd.concat(tables, ignore_index=True) if len(tables) > 0 else pd.DataFrame(), pd.DataFrame(results))
+
+
+def write_table(df: pd.DataFrame, fn: str):
+    if fn.lower().endswith('.xlsx'):
+        df.to_excel(fn, index=False)
+    else:
+        df.to_csv(fn, index=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Evaluate the gas consumption of many meters against their DWD stations in parallel')
+    parser.add_argument('manifest', help='CSV or xlsx with the columns name, readings, station, faktor_kwh_per_m3, warmwasser_energy_per_day')
+    parser.add_argument('--out', default='batch_results.csv', help='combined consumption table (.csv or .xlsx)')
+    parser.add_argument('--regressions', default='batch_regressions.csv', help='regression per meter (.csv or .xlsx)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, default: number of CPUs')
+    parser.add_argument('--offline', action='store_true', help='use cached DWD archives only')
+    args = parser.parse_args()
+
+    (dfout, regressions) = run_batch(read_manifest(args.manifest), max_workers=args.workers, cache=DownloadCache(offline=args.offline))
+    write_table(dfout, args.out)
+    write_table(regressions, args.regressions)
+    print(regressions.to_string())
@@ -0,0 +1,189 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import zipfile
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from DownloadCache import DownloadCache
+from SeriesCache import SeriesCache
+from Aggregates import Aggregates
+from TemperatureTimeCourse import TemperatureTimeCourse
+from gasverbrauch import read_readings, calc_consumption
+from LinearRegression import LinearRegression
+from changepoint import bootstrap_changepoint
+
+# Offline benchmark on synthetic data: a produkt_tu_stunde_ archive of a fake
+# station is put into an offline DownloadCache and Ablesung-Gas.xlsx shaped
+# readings are generated for the same period, at several scales.
+#
+#     python benchmark.py --out benchmark.json
+#     python benchmark.py --out new.json --compare benchmark.json
+#
+# Timings are seconds per call (min and median over --repeat runs).
+
+station = '99999'
+scales = {
+    'small': {'years': 2, 'readings': 100},
+    'medium': {'years': 10, 'readings': 1000},
+    'large': {'years': 30, 'readings': 10000},
+}
+start = datetime(1995, 1, 1)
+
+
+def synthetic_temperature(hours: np.ndarray) -> np.ndarray:
+    # annual and daily cycle, hours since start
+    return 8 + 10 * np.sin(2 * np.pi * (hours / (24 * 365.25) - 0.3)) + 4 * np.sin(2 * np.pi * (hours / 24 - 0.4))
+
+
+def make_archive(fn: str, years: int, seed: int = 1):
+    rnd = np.random.default_rng(seed)
+    hours = int(years * 365.25 * 24)
+    mess_datum = pd.date_range(start, periods=hours, freq='h').strftime('%Y%m%d%H')
+    temperatures = np.round(synthetic_temperature(np.arange(hours)) + rnd.normal(0, 1, hours), 1)
+    temperatures[rnd.random(hours) < 0.01] = -999
+    lines = ['STATIONS_ID;MESS_DATUM;QN_9;TT_TU;RF_TU;eor']
+    lines += [f'{int(station):11d};{d};    3;{tt:6.1f};  80.0;eor' for (d, tt) in zip(mess_datum, temperatures)]
+    end = (start + timedelta(hours=hours - 1)).strftime('%Y%m%d')
+    with zipfile.ZipFile(fn, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr(f'Metadaten_Geographie_{station}.txt', '')
+        z.writestr(f'produkt_tu_stunde_{start.strftime("%Y%m%d")}_{end}_{station}.txt', ('\r\n'.join(lines) + '\r\n').encode('latin-1'))
+
+
+def make_readings(years: int, n: int, seed: int = 2) -> pd.DataFrame:
+    # meter readings at random times within the archive, consumption rising below 15°C
+    rnd = np.random.default_rng(seed)
+    # whole minutes like real readings, without repeating a time (at the large scale some would coincide)
+    minutes = np.unique(np.round(rnd.uniform(24, years * 365.25 * 24 - 24, n) * 60))
+    hours = minutes / 60
+    t = pd.Timestamp(start) + pd.to_timedelta(minutes, unit='min')
+    hourly = np.maximum(15 - synthetic_temperature(np.arange(int(hours[-1]) + 1)), 0) * 0.5 / 24 + 0.6 / 24
+    energy = np.cumsum(hourly)[hours.astype(int)]
+    bemerkung = np.where(rnd.random(len(minutes)) < 0.02, 'Zwischenablesung', None)
+    return pd.DataFrame({'Ablesezeitpunkt': t, 'Zählerstand': np.round(100 + energy / 9.82, 3), 'Bemerkung': bemerkung})
+
+
+def timed(fn, repeat: int, number: int = 1) -> dict:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - t0) / number)
+    return {'min': min(times), 'median': float(np.median(times)), 'repeat': repeat, 'number': number}
+
+
+def prepare_cache(cache_dir: str, years: int) -> DownloadCache:
+    # an offline cache holding the synthetic archive under the url of the recent archive of the fake station
+    cache = DownloadCache(cache_dir, offline=True)
+    url = TemperatureTimeCourse.url0 + f'/hourly/air_temperature/recent/stundenwerte_TU_{station}_akt.zip'
+    (fn, _) = cache.paths(url)
+    os.makedirs(cache_dir, exist_ok=True)
+    make_archive(fn, years)
+    cache.save_metadata(url, {'url': url, 'etag': None, 'last_modified': None, 'fetched': time.time(), 'max_age': cache.max_age})
+    return cache
+
+
+def bench_cursor(dfout: pd.DataFrame, linear_regression: dict, repeat: int) -> dict:
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from AnnotatedCursor2 import AnnotatedCursor2
+    (fig, ax) = plt.subplots(figsize=(15, 8))
+    ax.scatter('temperatur', 'energy_per_day', s=8 * dfout['dt'], data=dfout)
+    fig.canvas.draw()
+    cursor = AnnotatedCursor2(data=dfout, ax=ax, useblit=True, linear_regression=linear_regression)
+    pixels = ax.transData.transform(dfout[['temperatur', 'energy_per_day']].to_numpy())
+    positions = itertools.cycle(pixels[np.random.default_rng(3).integers(len(pixels), size=1000)] + 1.0)
+    ret = {'cursor_index': timed(cursor.build_pixel_index, repeat),
+           'cursor_set_position': timed(lambda: cursor.set_position(0, 0, *next(positions)), repeat, number=1000)}
+    plt.close(fig)
+    return ret
+
+
+def run_scale(years: int, readings: int, repeat: int, workdir: str) -> dict:
+    cache = prepare_cache(os.path.join(workdir, 'dwdcache'), years)
+    timings = {}
+    # cold: parse the archive and store the series, every run with an empty series cache
+    cold = itertools.count()
+    timings['construct_cold'] = timed(lambda: TemperatureTimeCourse(station, cache=cache, historical=False,
+                                                                    series_cache=SeriesCache(os.path.join(workdir, f'series{next(cold)}'))), repeat)
+    # warm: memory-map the series stored by the cold runs
+    series_cache = SeriesCache(os.path.join(workdir, 'series0'))
+    timings['construct_warm'] = timed(lambda: TemperatureTimeCourse(station, cache=cache, historical=False, series_cache=series_cache), repeat)
+    ttc = TemperatureTimeCourse(station, cache=cache, historical=False, series_cache=series_cache)
+
+    rnd = np.random.default_rng(4)
+    moments = itertools.cycle([(start + timedelta(hours=h)).astimezone(TemperatureTimeCourse.berlin) for h in rnd.uniform(24, years * 365 * 24 - 48, 1000)])
+    timings['calc_temperature'] = timed(lambda: ttc.calc_temperature(next(moments)), repeat, number=1000)
+    timings['mean_day'] = timed(lambda: (lambda t: ttc.calc_mean_temperature(t, t + timedelta(days=1)))(next(moments)), repeat, number=1000)
+    year = start.year + years - 1
+    months = [(datetime(year, m, 1), datetime(year + (m == 12), m % 12 + 1, 1)) for m in range(1, 13)]
+    timings['mean_months'] = timed(lambda: [ttc.calc_mean_temperature(t0, t1) for (t0, t1) in months], repeat)
+    timings['mean_year'] = timed(lambda: ttc.calc_mean_temperature(datetime(year, 1, 1), datetime(year + 1, 1, 1)), repeat)
+    timings['aggregates_build'] = timed(lambda: Aggregates(ttc), repeat)
+    timings['summary_year'] = timed(lambda: ttc.aggregates().summary(datetime(year, 1, 1), datetime(year + 1, 1, 1)), repeat, number=100)
+
+    df = make_readings(years, readings)
+    xls_fn = os.path.join(workdir, 'Ablesung-Gas.xlsx')
+    df.to_excel(xls_fn, sheet_name='Sheet1', index=False, engine='openpyxl')
+    timings['read_readings'] = timed(lambda: read_readings(xls_fn), repeat)
+    df = read_readings(xls_fn)
+    timings['consumption'] = timed(lambda: calc_consumption(df, ttc), repeat)
+    dfout = calc_consumption(df, ttc)
+
+    def regression():
+        r = LinearRegression()
+        r.add(dfout['temperatur'], dfout['energy_per_day'])
+        return r.fit()
+    timings['regression'] = timed(regression, repeat)
+    timings['changepoint_bootstrap'] = timed(lambda: bootstrap_changepoint(dfout['temperatur'], dfout['energy_per_day'], n_boot=200, seed=0), repeat)
+    timings.update(bench_cursor(dfout, regression(), repeat))
+    return {'parameters': {'years': years, 'readings': readings, 'samples': len(ttc), 'intervals': len(dfout)}, 'timings': timings}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 1.2):
+    print(f'{"scale":8} {"phase":24} {"baseline":>12} {"current":>12} {"ratio":>7}')
+    for (name, scale) in results['scales'].items():
+        base = baseline['scales'].get(name, {}).get('timings', {})
+        for (phase, timing) in scale['timings'].items():
+            if phase not in base:
+                continue
+            ratio = timing['median'] / base[phase]['median']
+            flag = '  slower' if ratio > tolerance else ('  faster' if ratio < 1 / tolerance else '')
+            print(f'{name:8} {phase:24} {base[phase]["median"]:12.6f} {timing["median"]:12.6f} {ratio:7.2f}{flag}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline benchmark on synthetic DWD archives and meter readings')
+    parser.add_argument('--out', default='benchmark.json', help='JSON file for the results')
+    parser.add_argument('--scales', default=','.join(scales), help='comma separated subset of ' + ', '.join(scales))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare with')
+    args = parser.parse_args()
+
+    results = {'created': datetime.now().isoformat(timespec='seconds'), 'commit': git_commit(),
+               'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+               'platform': platform.platform(), 'repeat': args.repeat, 'scales': {}}
+    for name in args.scales.split(','):
+        with tempfile.TemporaryDirectory() as workdir:
+            results['scales'][name] = run_scale(scales[name]['years'], scales[name]['readings'], args.repeat, workdir)
+        print(f'{name}: ' + ', '.join(f'{phase}={timing["median"]:.3g}s' for (phase, timing) in results['scales'][name]['timings'].items()))
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare(results, json.load(f))
@@ -0,0 +1,29 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from DownloadCache import DownloadCache
+from TemperatureTimeCourse import TemperatureTimeCourse
+
+# Loads many stations concurrently. All downloads go through one pooled
+# session with retries, each worker parses its archive as soon as it has
+# arrived, so a regional set of stations takes about as long as the slowest
+# download instead of the sum of all of them.
+
+
+def load_stations(stations, max_workers: int = 8, retries: int = 3, cache: DownloadCache = None, **kwargs) -> dict:
+    # kwargs are passed to TemperatureTimeCourse, returns {station: TemperatureTimeCourse} in the order of stations
+    if cache is None:
+        cache = DownloadCache()
+    if cache.session is None and not cache.offline:
+        cache.session = DownloadCache.make_session(pool_size=max_workers, retries=retries)
+    stations = list(stations)
+    if len(stations) > 0:
+        # the directory listing of the historical archives is shared by all stations, fetch it once up front
+        first = TemperatureTimeCourse(stations[0], cache=cache, **{**kwargs, 'lazy': True})
+        (urlpath, tag, urlpath_historical) = first.source
+        if urlpath_historical is not None:
+            first.find_historical(urlpath_historical)
+    courses = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(TemperatureTimeCourse, station, cache=cache, **kwargs): station for station in stations}
+        for future in as_completed(futures):
+            courses[futures[future]] = future.result()
+    return {station: courses[station] for station in stations}
@@ -0,0 +1,73 @@
+import numpy as np
+
+# Heating changepoint model: below the balance temperature tb consumption
+# rises linearly, above it only the base load b remains
+#
+#     y = a * min(t - tb, 0) + b
+#
+# For every candidate tb the model is linear in a and b, so all candidates
+# are solved at once from weighted sums (one matrix product over the grid).
+# Bootstrap resamples are expressed as multinomial count weights, which turns
+# thousands of refits into a few more matrix products.
+
+
+def default_grid(t, step: float = 0.1) -> np.ndarray:
+    t = np.asarray(t, dtype=float)
+    return np.round(np.arange(np.floor(t.min()), np.ceil(t.max()) + step, step), 6)
+
+
+def grid_fit(t: np.ndarray, y: np.ndarray, grid: np.ndarray, weights: np.ndarray) -> dict:
+    # weights: (B, n) one row of weights per fit, returns arrays of shape (B, len(grid))
+    x = np.minimum(t[np.newaxis, :] - grid[:, np.newaxis], 0.0)  # (G, n)
+    sw = weights.sum(axis=1)[:, np.newaxis]
+    sy = (weights @ y)[:, np.newaxis]
+    syy = (weights @ (y * y))[:, np.newaxis]
+    sx = weights @ x.T
+    sxx = weights @ (x * x).T
+    sxy = weights @ (x * y).T
+    cxx = sxx - sx * sx / sw
+    cxy = sxy - sx * sy / sw
+    cyy = syy - sy * sy / sw
+    # a balance temperature below all samples leaves only the constant model
+    degenerate = cxx <= 1e-12 * np.maximum(sxx, 1.0)
+    a = np.where(degenerate, 0.0, cxy / np.where(degenerate, 1.0, cxx))
+    b = (sy - a * sx) / sw
+    ssr = np.maximum(cyy - a * cxy, 0.0)
+    return {'a': a, 'b': b, 'ssr': ssr, 'cyy': np.broadcast_to(cyy, ssr.shape)}
+
+
+def fit_changepoint(t, y, w=None, grid=None) -> dict:
+    t = np.asarray(t, dtype=float)
+    y = np.asarray(y, dtype=float)
+    w = np.ones(len(t)) if w is None else np.asarray(w, dtype=float)
+    grid = default_grid(t) if grid is None else np.asarray(grid, dtype=float)
+    fits = grid_fit(t, y, grid, w[np.newaxis, :])
+    best = int(np.argmin(fits['ssr'][0]))
+    cyy = fits['cyy'][0, best]
+    return {'tb': float(grid[best]), 'a': float(fits['a'][0, best]), 'b': float(fits['b'][0, best]),
+            'R**2': float(1 - fits['ssr'][0, best] / cyy) if cyy > 0 else 1.0, 'n': len(t)}
+
+
+def bootstrap_changepoint(t, y, w=None, grid=None, n_boot: int = 2000, ci: float = 0.95, seed=None, chunk: int = 500) -> dict:
+    # percentile confidence intervals of tb, a and b from n_boot resamples, computed chunk resamples at a time
+    t = np.asarray(t, dtype=float)
+    y = np.asarray(y, dtype=float)
+    w = np.ones(len(t)) if w is None else np.asarray(w, dtype=float)
+    grid = default_grid(t) if grid is None else np.asarray(grid, dtype=float)
+    rng = np.random.default_rng(seed)
+    samples = {'tb': [], 'a': [], 'b': []}
+    for start in range(0, n_boot, chunk):
+        counts = rng.multinomial(len(t), np.full(len(t), 1.0 / len(t)), size=min(chunk, n_boot - start))
+        fits = grid_fit(t, y, grid, counts * w[np.newaxis, :])
+        best = np.argmin(fits['ssr'], axis=1)
+        rows = np.arange(len(best))
+        samples['tb'].append(grid[best])
+        samples['a'].append(fits['a'][rows, best])
+        samples['b'].append(fits['b'][rows, best])
+    ret = fit_changepoint(t, y, w, grid)
+    q = [(1 - ci) / 2 * 100, (1 + ci) / 2 * 100]
+    for name, values in samples.items():
+        (lo, hi) = np.percentile(np.concatenate(values), q)
+        ret[name + '_ci'] = (float(lo), float(hi))
+    ret['n_boot'] = n_boot
+    return ret
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+from TemperatureTimeCourse import TemperatureTimeCourse
+
+# Consumption per reading interval, computed column by column instead of row by row.
+
+faktor_kwh_per_m3 = 9.82
+warmwasser_energy_per_day = 0.60 * faktor_kwh_per_m3
+
+
+def read_readings(xls_fn: str = './Ablesung-Gas.xlsx') -> pd.DataFrame:
+    df = pd.read_excel(xls_fn, sheet_name='Sheet1', engine='openpyxl', dtype='string')
+    df['Ablesezeitpunkt'] = pd.to_datetime(df['Ablesezeitpunkt'], format='%Y-%m-%d %H:%M:%S')
+    df['Zählerstand'] = pd.to_numeric(df['Zählerstand'])
+    return df
+
+
+def calc_intervals(df: pd.DataFrame,
+                   faktor_kwh_per_m3: float = faktor_kwh_per_m3, warmwasser_energy_per_day: float = warmwasser_energy_per_day,
+                   ambiguous: str = None, nonexistent: str = None) -> pd.DataFrame:
+    # one row per interval between two consecutive readings, without temperature,
+    # intervals ending in a reading with an entry in column Bemerkung are skipped;
+    # key0 / key1 are the interval boundaries as TemperatureTimeCourse keys (naive times in Europe/Berlin, converted with
+    # the given DST policies), dt is taken from them, so it covers the same time as the mean temperature
+    t = pd.to_datetime(df['Ablesezeitpunkt'], format='%Y-%m-%d %H:%M:%S').to_numpy()
+    keys = TemperatureTimeCourse.datetimes_to_keys(t, ambiguous, nonexistent)
+    z = pd.to_numeric(df['Zählerstand']).to_numpy(dtype=float)
+    valid = df['Bemerkung'].isna().to_numpy()[1:] if 'Bemerkung' in df else np.ones(max(len(t) - 1, 0), dtype=bool)
+    # around the DST switch consecutive local times can map to keys that do not increase (e.g. 01:45 -> 02:00 at the
+    # start of DST with nonexistent='backward'), such intervals have no duration and are skipped
+    valid = valid & (keys[1:] > keys[:-1])
+    t0 = t[:-1][valid]
+    t1 = t[1:][valid]
+    key0 = keys[:-1][valid]
+    key1 = keys[1:][valid]
+    z0 = z[:-1][valid]
+    z1 = z[1:][valid]
+    dt = (key1 - key0) / 86400
+    dfout = pd.DataFrame({'t0': t0, 't1': t1, 'dt': dt, 'zählerstand0': z0, 'zählerstand1': z1, 'verbrauch': z1 - z0,
+                          'key0': key0, 'key1': key1})
+    dfout['temperatur'] = float('nan')
+    dfout['energy_per_day'] = dfout['verbrauch'] * faktor_kwh_per_m3 / dt - warmwasser_energy_per_day
+    return dfout
+
+
+def calc_consumption(df: pd.DataFrame, station: TemperatureTimeCourse,
+                     faktor_kwh_per_m3: float = faktor_kwh_per_m3, warmwasser_energy_per_day: float = warmwasser_energy_per_day) -> pd.DataFrame:
+    dfout = calc_intervals(df, faktor_kwh_per_m3, warmwasser_energy_per_day, station.ambiguous, station.nonexistent)
+    if len(dfout) > 0:
+        dfout['temperatur'] = station.means_between_keys(dfout['key0'].to_numpy(), dfout['key1'].to_numpy())
+    return dfout.drop(columns=['key0', 'key1'])
@@ -4,8 +4,8 @@ import io
 import zipfile
 from zoneinfo import ZoneInfo
 from datetime import datetime, timedelta
-import requests
-from sortedcontainers import SortedDict
+from DownloadCache import DownloadCache
+from Stats import Stats
 
 url0 = 'https://opendata.dwd.de/climate_environment/CDC/observations_germany/climate'
 
@@ -21,6 +21,8 @@ outfndaily = 'tageswerte_KL_13777_akt'
 tz_berlin = ZoneInfo('Europe/Berlin')
 utc = ZoneInfo('UTC')
 basetime: datetime = datetime.fromisoformat('1992-01-01T00:00:00Z')
+cache = DownloadCache()
+stats = None  # set to a Stats object to time and count downloading, parsing and queries
 
 def to_sec(datetimestr: str, tz: ZoneInfo) -> int:
     t: datetime = datetime.strptime(datetimestr, '%Y%m%d%H').astimezone(tz)
@@ -28,20 +30,21 @@ def to_sec(datetimestr: str, tz: ZoneInfo) -> int:
     return int(dt.total_seconds())
 
 def getdwddata(urlpath, outfn, tag):
-    r = requests.get(url0 + urlpath)
-    assert r.ok
-    with open(outfn + '.zip', 'wb') as outf:
-        outf.write(r.content)
-    with io.BytesIO(r.content) as f:
+    from sortedcontainers import SortedDict
+    cache.stats = stats
+    with Stats.phase_of(stats, 'fetch'):
+        fn = cache.fetch(url0 + urlpath)
+    with open(fn, 'rb') as f:
         with zipfile.ZipFile(f, 'r') as z:
             zdir = z.namelist()
             matches = [match for match in zdir if tag in match]
             assert len(matches) == 1
             with z.open(matches[0]) as zf:
-                raw_data = zf.read()
-                with open(outfn + '.csv', 'wb') as f2:
-                    f2.write(raw_data)
-                with io.TextIOWrapper(io.BytesIO(raw_data), newline='') as f3:
+                with Stats.phase_of(stats, 'unzip'):
+                    raw_data = zf.read()
+                    with open(outfn + '.csv', 'wb') as f2:
+                        f2.write(raw_data)
+                with Stats.phase_of(stats, 'parse'), io.TextIOWrapper(io.BytesIO(raw_data), newline='') as f3:
                     dict1 = SortedDict()
                     reader = csv.reader(f3, delimiter=';')
                     headers = next(reader)
@@ -53,6 +56,10 @@ def getdwddata(urlpath, outfn, tag):
                         if tt_tu != -999:
                             dti: int = to_sec(entry['MESS_DATUM'], tz=utc)
                             dict1[dti] = entry
+                        elif stats is not None:
+                            stats.count('rows_skipped')
+                    if stats is not None:
+                        stats.count('rows_parsed', reader.line_num - 1)
     return dict1
 
 
@@ -64,10 +71,15 @@ def getdwddatahourly():
     return getdwddata(urlhourly, outfnhourly, taghourly)
 
 
-hourly_data = getdwddatahourly()
+hourly_data = None  # loaded on first use, importing this module does not download anything
 
 
 def calc_mean_temperature(t0: datetime, t1: datetime):
+    global hourly_data
+    if hourly_data is None:
+        hourly_data = getdwddatahourly()
+    if stats is not None:
+        stats.count('mean_queries')
     n = 0
     sumup = 0.0
     while t0 < t1: